@@ -0,0 +1,79 @@
+#!/usr/bin/env python
+
+"""Micro-benchmark of the operations whose cost depends on the stack or on
+the number they are given: Roll, Switch and Pointer"""
+
+import sys
+import getopt
+import timeit
+import interpreter
+import stack
+
+__author__ = "Steven Anderson"
+__copyright__ = "Steven Anderson 2008"
+__credits__ = ["Steven Anderson"]
+__license__ = "GPL"
+__version__ = "0.0.1"
+__maintainer__ = "Steven Anderson"
+__email__ = "steven.james.anderson@googlemail.com"
+__status__ = "Production"
+
+DEPTHS = [10,100,1000,10000,100000]
+#Counts that aren't multiples of the depths, so the stack is always rotated
+COUNTS = [1,999,999999,-999999,10**30+1]
+
+def time_op(op,items,operands,repeat):
+    """Gets the best time in microseconds of an operation of an interpreter
+    with the given items on its stack, with the operands pushed before each
+    run."""
+    program = interpreter.Interpreter()
+    program.stack = stack.Stack(items)
+    operation = getattr(program,op)
+    def run():
+        program.stack.extend(operands)
+        operation()
+    return min(timeit.repeat(run,number=1,repeat=repeat))*1000000
+
+def benchmark(depths=DEPTHS,counts=COUNTS,repeat=20):
+    """Prints the time of Roll at each depth with each count, then of Switch
+    and Pointer with each count. The time of Roll should grow with the
+    depth but not the count."""
+    print "Roll (microseconds)"
+    print "%10s" % ("depth") + "".join("%16s" % ("count %s" % (count if abs(count) < 10**9 else "%.0e" % (count))) for count in counts)
+    for depth in depths:
+        times = [time_op("op_roll",range(depth),[depth,count],repeat) for count in counts]
+        print "%10d" % (depth) + "".join("%16.1f" % (time) for time in times)
+    for op, name in [("op_switch","Switch"),("op_pointer","Pointer")]:
+        print "\n%s (microseconds)" % (name)
+        print "".join("%16s" % ("count %s" % (count if abs(count) < 10**9 else "%.0e" % (count))) for count in counts)
+        print "".join("%16.1f" % (time_op(op,[],[count],repeat)) for count in counts)
+
+def print_usage():
+    """Prints usage string for command line."""
+    print "Piedit v0.0.1 - Python Piet IDE\n"
+    print "Usage: benchmark.py [<options>]"
+    print "Times Roll at several stack depths and counts, and Switch and Pointer with several counts."
+    print "options:"
+    print "\t-h (--help)\t- Prints this help"
+    print "\t-d (--depths)\t- Sets the depths to time Roll at, separated by commas."
+    print "\t-r (--repeat)\t- Sets how many times each operation is timed, the best time being printed. This is 20 by default."
+
+#Run the benchmark if on command line
+if __name__ == "__main__":
+    try:
+        opts,args = getopt.getopt(sys.argv[1:], "hd:r:", ["help","depths=","repeat="])
+    except getopt.GetoptError, err:
+        print str(err)
+        print_usage()
+        sys.exit(2)
+    depths = DEPTHS
+    repeat = 20
+    for o,a in opts:
+        if o in ["-h","--help"]:
+            print_usage()
+            sys.exit(1)
+        elif o in ["-d","--depths"]:
+            depths = [int(depth) for depth in a.split(",")]
+        elif o in ["-r","--repeat"]:
+            repeat = int(a)
+    benchmark(depths,COUNTS,repeat)
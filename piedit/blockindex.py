@@ -0,0 +1,121 @@
+"""Color block index that is kept up to date as the program is edited"""
+
+from array import array
+import colors
+import grid
+
+__author__ = "Steven Anderson"
+__copyright__ = "Steven Anderson 2008"
+__credits__ = ["Steven Anderson"]
+__license__ = "GPL"
+__version__ = "0.0.1"
+__maintainer__ = "Steven Anderson"
+__email__ = "steven.james.anderson@googlemail.com"
+__status__ = "Production"
+
+
+class BlockIndex(object):
+    """Class that holds the labeled color blocks of a program being edited.
+    The whole program is labeled once, then each edited codel only relabels
+    the blocks that touch it, so the work done by an edit is in proportion
+    to the size of those blocks rather than the size of the program.
+
+    Labels of blocks that are gone are reused, so unlike grid.label_blocks
+    the labels aren't in the order the blocks are first met."""
+
+    def __init__(self,pixels,width,height):
+        """Initializes new BlockIndex from a flat sequence of palette indices."""
+        self.grid = grid.from_pixels(pixels,width,height)
+        self.color_blocks = grid.label_blocks(self.grid)
+        #Labels no longer used by any block
+        self.free_labels = []
+
+    def snapshot(self):
+        """Returns a copy of the labeled grid and the color blocks, which the
+        interpreter can use while the program carries on being edited."""
+        snapshot = grid.CodelGrid(self.grid.width,self.grid.height,self.grid.codels[:])
+        snapshot.labels = self.grid.labels[:]
+        snapshot.sizes = self.grid.sizes[:]
+        return (snapshot, dict(self.color_blocks))
+
+    def set_codel(self,x,y,color):
+        """Sets the palette index of the codel at x and y. The block the codel
+        leaves may be split and the blocks it joins are merged."""
+        codels = self.grid.codels
+        labels = self.grid.labels
+        index = y*self.grid.width+x
+        if codels[index] == color:
+            return
+        old_label = labels[index]
+        codels[index] = color
+        labels[index] = -1
+        old_labels = set()
+        if old_label != -1:
+            old_labels.add(old_label)
+
+        #Merge with the blocks of the new color around the codel
+        if not (colors.is_white(color) or colors.is_black(color)):
+            old_labels.update(self.fill_block(index))
+
+        #Each part of the old block left around the codel becomes a block
+        if old_label != -1:
+            for neighbor in self.neighbors(index):
+                if labels[neighbor] == old_label:
+                    self.fill_block(neighbor)
+
+        for label in old_labels:
+            self.grid.sizes[label] = 0
+            del self.color_blocks[label]
+            self.free_labels.append(label)
+
+    def neighbors(self,index):
+        """Gets the indices of the codels above, below, left and right of a codel."""
+        width = self.grid.width
+        x = index%width
+        neighbors = []
+        if x > 0:
+            neighbors.append(index-1)
+        if x < width-1:
+            neighbors.append(index+1)
+        if index >= width:
+            neighbors.append(index-width)
+        if index+width < len(self.grid.codels):
+            neighbors.append(index+width)
+        return neighbors
+
+    def fill_block(self,start):
+        """Gives the whole block holding the codel at start a new label and
+        builds its ColorBlock. Returns the labels the block used to cover."""
+        codels = self.grid.codels
+        labels = self.grid.labels
+        color = codels[start]
+        label = self.new_label()
+        old_labels = set()
+        if labels[start] != -1:
+            old_labels.add(labels[start])
+        labels[start] = label
+        pixels = [start]
+        stack = [start]
+        while stack:
+            for neighbor in self.neighbors(stack.pop()):
+                if codels[neighbor] == color and labels[neighbor] != label:
+                    if labels[neighbor] != -1:
+                        old_labels.add(labels[neighbor])
+                    labels[neighbor] = label
+                    pixels.append(neighbor)
+                    stack.append(neighbor)
+
+        color_block = grid.ColorBlock(len(pixels))
+        for index in sorted(pixels):
+            y, x = divmod(index,self.grid.width)
+            color_block.update_boundaries(x,y)
+        self.grid.sizes[label] = len(pixels)
+        self.color_blocks[label] = color_block
+        return old_labels
+
+    def new_label(self):
+        """Gets an unused label."""
+        if self.free_labels:
+            return self.free_labels.pop()
+        self.grid.sizes.append(0)
+        return len(self.grid.sizes)-1
@@ -0,0 +1,129 @@
+"""On disk cache of compiled programs, so a program run again isn't labeled
+and compiled from scratch"""
+
+import os
+import time
+import hashlib
+import tempfile
+import cPickle
+from array import array
+import grid
+import transitions
+
+__author__ = "Steven Anderson"
+__copyright__ = "Steven Anderson 2008"
+__credits__ = ["Steven Anderson"]
+__license__ = "GPL"
+__version__ = "0.0.1"
+__maintainer__ = "Steven Anderson"
+__email__ = "steven.james.anderson@googlemail.com"
+__status__ = "Production"
+
+#Layout of an entry: the labels, sizes and boundaries of the grid and the
+#TransitionTable. Bump it whenever this changes, so old entries aren't used.
+#The layout of the table itself is transitions.FORMAT.
+FORMAT = 1
+#Entries are removed once the cache is bigger than this, oldest used first
+MAX_SIZE = 64*1024*1024
+#Entries not used for this many seconds are removed
+MAX_AGE = 30*24*60*60
+#Ending of the file of each entry
+EXTENSION = ".cache"
+
+def key(codel_grid):
+    """Gets the key of a grid, a hash of its codels and size along with the
+    layouts of the entry and of the TransitionTable, so entries stored in
+    another layout are never loaded."""
+    digest = hashlib.sha1("%d %d %d %d %d\n" % (FORMAT,transitions.FORMAT,codel_grid.width,codel_grid.height,codel_grid.codel_size))
+    digest.update(buffer(codel_grid.codels))
+    return digest.hexdigest()
+
+def entry_path(cache_dir,codel_grid):
+    """Gets the path of the file of the entry for a grid."""
+    return os.path.join(cache_dir,key(codel_grid)+EXTENSION)
+
+def load(cache_dir,codel_grid):
+    """Loads the labels and sizes of a grid from the cache, and returns its
+    color blocks and TransitionTable, which is None if it wasn't stored.
+    Returns None if the grid isn't in the cache. The entries are unpickled,
+    so the directory must be one no one else can write to."""
+    path = entry_path(cache_dir,codel_grid)
+    try:
+        entry = open(path,"rb")
+        try:
+            labels, sizes, boundaries, table = cPickle.load(entry)
+        finally:
+            entry.close()
+        #Mark the entry as used, for cleaning up
+        os.utime(path,None)
+    except Exception:
+        #A missing or damaged entry is a miss
+        return None
+    codel_grid.labels = array('i')
+    codel_grid.labels.fromstring(labels)
+    codel_grid.sizes = array('i')
+    codel_grid.sizes.fromstring(sizes)
+    color_blocks = {}
+    for label, boundary_pixels in boundaries.items():
+        color_blocks[label] = grid.ColorBlock(codel_grid.sizes[label])
+        color_blocks[label].boundary_pixels = boundary_pixels
+    return (color_blocks, table)
+
+def save(cache_dir,codel_grid,color_blocks,table=None):
+    """Saves the labels, sizes and color blocks of a grid in the cache, along
+    with its TransitionTable if it has been compiled, then cleans the cache
+    up. Failing to write to the cache isn't an error."""
+    boundaries = dict((label, color_block.boundary_pixels) for label, color_block in color_blocks.items())
+    entry = (str(buffer(codel_grid.labels)), str(buffer(codel_grid.sizes)), boundaries, table)
+    try:
+        if not os.path.isdir(cache_dir):
+            os.makedirs(cache_dir)
+        #Written to a new file first, so no one reads half an entry
+        (fd, temp_path) = tempfile.mkstemp(EXTENSION+".tmp",dir=cache_dir)
+        temp_file = os.fdopen(fd,"wb")
+        try:
+            cPickle.dump(entry,temp_file,cPickle.HIGHEST_PROTOCOL)
+        finally:
+            temp_file.close()
+        os.rename(temp_path,entry_path(cache_dir,codel_grid))
+        clean(cache_dir)
+    except (IOError,OSError):
+        pass
+
+def clean(cache_dir,max_size=MAX_SIZE,max_age=MAX_AGE):
+    """Removes the entries not used for max_age seconds, then the least
+    recently used entries until the cache is no bigger than max_size."""
+    entries = []
+    now = time.time()
+    for name in os.listdir(cache_dir):
+        if not name.endswith(EXTENSION):
+            continue
+        path = os.path.join(cache_dir,name)
+        try:
+            stat = os.stat(path)
+            if now-stat.st_mtime > max_age:
+                os.remove(path)
+            else:
+                entries.append((stat.st_mtime,stat.st_size,path))
+        except OSError:
+            pass
+    size = sum(entry[1] for entry in entries)
+    for mtime, entry_size, path in sorted(entries):
+        if size <= max_size:
+            break
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+        size = size - entry_size
+
+def clear(cache_dir):
+    """Removes every entry from the cache."""
+    if not os.path.isdir(cache_dir):
+        return
+    for name in os.listdir(cache_dir):
+        if name.endswith(EXTENSION) or name.endswith(EXTENSION+".tmp"):
+            try:
+                os.remove(os.path.join(cache_dir,name))
+            except OSError:
+                pass
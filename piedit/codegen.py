@@ -0,0 +1,198 @@
+"""Generates Python source code for straight runs of Piet operations"""
+
+import sys
+import atexit
+import output
+
+__author__ = "Steven Anderson"
+__copyright__ = "Steven Anderson 2008"
+__credits__ = ["Steven Anderson"]
+__license__ = "GPL"
+__version__ = "0.0.1"
+__maintainer__ = "Steven Anderson"
+__email__ = "steven.james.anderson@googlemail.com"
+__status__ = "Production"
+
+#Operation codes, as in Interpreter.operations
+PUSH = 1
+POP = 2
+ADD = 3
+SUBTRACT = 4
+MULTIPLY = 5
+DIVIDE = 6
+MOD = 7
+NOT = 8
+GREATER = 9
+POINTER = 10
+SWITCH = 11
+DUPLICATE = 12
+ROLL = 13
+IN_NUMBER = 14
+IN_CHAR = 15
+OUT_NUMBER = 16
+OUT_CHAR = 17
+
+#Operations with a stack effect that can be worked out at compile time
+STRAIGHT_OPS = frozenset([0,PUSH,POP,ADD,SUBTRACT,MULTIPLY,DIVIDE,MOD,NOT,
+    GREATER,DUPLICATE,OUT_NUMBER,OUT_CHAR])
+#Operations that branch, which can be compiled for one known outcome
+BRANCH_OPS = frozenset([POINTER,SWITCH])
+
+#Sink the output of the generated code goes to when it isn't given the
+#write method of the interpreter's sink. What is left in it is flushed when
+#Python exits.
+stdout = output.StdoutSink()
+write = stdout.write
+atexit.register(stdout.flush)
+
+#Namespace the generated code is run in
+namespace = {"sys": sys, "write": write}
+
+
+class StraightLine(object):
+    """Class that writes the source of a Python function doing a straight run
+    of operations on a stack.Stack. The items of the stack are only read
+    while the operations are done, with every item kept in a local variable,
+    and the new top of the stack is written back once at the end.
+
+    The function checks once at the start that the stack is deep enough for
+    every operation. If it isn't, or if an operation would fail, such as a
+    division by zero, it stops before that operation with the stack as the
+    operations before it left it. It returns the number of operations done.
+
+    Pointer and Switch can be added for one outcome, the turns of the DP or
+    whether the CC is toggled. The function stops before them if the item on
+    the stack would give another outcome. A function that loops does the
+    operations over again up to the given number of iterations, returning the
+    number of operations done over all of them. Output goes to the write
+    function, which writes to a sink on stdout by default."""
+
+    def __init__(self,name,loop=False,indent="    "):
+        """Initializes new StraightLine for a function with the given name."""
+        self.name = name
+        self.loop = loop
+        self.indent = indent
+        self.lines = []
+        #Items pushed by the operations so far, as Python expressions
+        self.pushed = []
+        #Number of items the operations so far have taken off the stack
+        self.taken = 0
+        self.temps = 0
+        self.count = 0
+
+    def add_op(self,op,value=None):
+        """Adds an operation. Push takes the value to be pushed, Pointer the
+        number of turns of the DP, and Switch whether the CC is toggled."""
+        pushed, taken = list(self.pushed), self.taken
+        if op == 0:
+            pass
+        elif op == PUSH:
+            self.push(str(value))
+        elif op == POP:
+            self.pop()
+        elif op == ADD:
+            top, second = self.pop(), self.pop()
+            self.push_temp("%s + %s" % (top,second))
+        elif op == SUBTRACT:
+            top, second = self.pop(), self.pop()
+            self.push_temp("%s - %s" % (second,top))
+        elif op == MULTIPLY:
+            top, second = self.pop(), self.pop()
+            self.push_temp("%s * %s" % (top,second))
+        elif op == DIVIDE or op == MOD:
+            top, second = self.pop(), self.pop()
+            self.stop_if("%s == 0" % (top),pushed,taken)
+            self.push_temp("%s %s %s" % (second,("/","%")[op == MOD],top))
+        elif op == NOT:
+            self.push_temp("int(not %s)" % (self.pop()))
+        elif op == GREATER:
+            top, second = self.pop(), self.pop()
+            self.push_temp("int(%s > %s)" % (second,top))
+        elif op == DUPLICATE:
+            item = self.pop()
+            self.push(item)
+            self.push(item)
+        elif op == OUT_NUMBER:
+            self.line("write(str(%s))" % (self.pop()))
+        elif op == POINTER:
+            item = self.pop()
+            self.stop_if("%s %% 4 != %d" % (item,value),pushed,taken)
+        elif op == SWITCH:
+            item = self.pop()
+            self.stop_if("%s %% 2 != %d" % (item,bool(value)),pushed,taken)
+        elif op == OUT_CHAR:
+            item = self.pop()
+            self.stop_if("not 0 <= %s < 256" % (item),pushed,taken)
+            self.line("write(chr(%s))" % (item))
+        else:
+            raise ValueError, "Operation %s can't be compiled" % (op)
+        self.count = self.count + 1
+
+    def source(self):
+        """Gets the source of the function."""
+        lines = ["def %s(stack,iterations=1,write=write):" % (self.name)]
+        body = self.indent
+        if self.loop:
+            lines.append(body+"length = %d" % (self.count))
+            lines.append(body+"for iteration in xrange(iterations):")
+            body = body+self.indent
+        #Writing back may have moved the items to a list
+        lines.append(body+"items = stack.items")
+        lines.append(body+"if len(items) < %d:" % (self.taken))
+        lines.append(body+self.indent+"return %s" % (self.done(0)))
+        lines.extend(body+line for line in self.lines)
+        lines.extend(body+line for line in self.write_back(self.pushed,self.taken))
+        if self.loop:
+            lines.append(self.indent+"return iterations*length")
+        else:
+            lines.append(self.indent+"return %d" % (self.count))
+        return "\n".join(lines)+"\n"
+
+    def done(self,count):
+        """Gets the expression for the number of operations done when the
+        function stops before the given operation."""
+        if self.loop:
+            return "iteration*length+%d" % (count)
+        return "%d" % (count)
+
+    def compile(self):
+        """Compiles the function and returns it."""
+        exec compile(self.source(),"<%s>" % (self.name),"exec") in namespace
+        return namespace.pop(self.name)
+
+    def line(self,line):
+        """Adds a line of source."""
+        self.lines.append(line)
+
+    def push(self,item):
+        """Pushes an expression."""
+        self.pushed.append(item)
+
+    def push_temp(self,expression):
+        """Works out an expression into a new local variable and pushes it."""
+        self.temps = self.temps + 1
+        self.line("t%d = %s" % (self.temps,expression))
+        self.push("t%d" % (self.temps))
+
+    def pop(self):
+        """Pops an item, reading it from the stack if it wasn't pushed by
+        these operations."""
+        if self.pushed:
+            return self.pushed.pop()
+        self.taken = self.taken + 1
+        self.line("s%d = items[-%d]" % (self.taken,self.taken))
+        return "s%d" % (self.taken)
+
+    def stop_if(self,condition,pushed,taken):
+        """Stops before the current operation if the condition is true. The
+        pushed items and taken count are those before the operation."""
+        self.line("if %s:" % (condition))
+        for line in self.write_back(pushed,taken):
+            self.line(self.indent+line)
+        self.line(self.indent+"return %s" % (self.done(self.count)))
+
+    def write_back(self,pushed,taken):
+        """Gets the lines that write the top of the stack back."""
+        if not pushed and not taken:
+            return []
+        return ["stack.replace_top(%d,[%s])" % (taken,", ".join(pushed))]
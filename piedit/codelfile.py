@@ -0,0 +1,222 @@
+#!/usr/bin/env python
+
+"""Binary codel file format, which loads without decoding an image.
+
+A codel file is a header, then one byte per codel holding its palette index,
+in row order. It can also hold the labels of the color blocks, so they
+don't have to be worked out when it is run. All numbers are 32 bit little
+endian.
+
+    Header      magic "PIET", version (byte), flags (byte), 2 bytes unused,
+                width, height, codel size in pixels, number of color blocks
+    Codels      width*height bytes, padded to a multiple of 4
+    Labels      if flags has HAS_LABELS, the label of each codel,
+                the size of each color block,
+                and the 8 boundary pixels of each block as x,y pairs"""
+
+import sys
+import os.path
+import getopt
+import struct
+import mmap
+import ctypes
+from array import array
+import PIL.Image
+import colors
+import grid
+
+__author__ = "Steven Anderson"
+__copyright__ = "Steven Anderson 2008"
+__credits__ = ["Steven Anderson"]
+__license__ = "GPL"
+__version__ = "0.0.1"
+__maintainer__ = "Steven Anderson"
+__email__ = "steven.james.anderson@googlemail.com"
+__status__ = "Production"
+
+MAGIC = "PIET"
+VERSION = 1
+#Flags
+HAS_LABELS = 1
+header_format = struct.Struct("<4sBBxxIIII")
+#Ending of codel files
+EXTENSION = ".codels"
+#Bytes that are palette indices, which are all a codel may hold
+palette_bytes = "".join(chr(index) for index in xrange(len(colors.colors)))
+
+def is_codel_file(path):
+    """Tells us whether the file at the given path is a codel file."""
+    try:
+        codel_file = open(path,"rb")
+        try:
+            return codel_file.read(len(MAGIC)) == MAGIC
+        finally:
+            codel_file.close()
+    except IOError:
+        return False
+
+def padded(length):
+    """Rounds a length up to a multiple of 4."""
+    return (length+3) & ~3
+
+def int_view(data,offset,count):
+    """Gets count 32 bit integers from offset in a mapped file. On little
+    endian machines they are used where they are without a copy."""
+    if sys.byteorder == "little":
+        return (ctypes.c_int32*count).from_buffer(data,offset)
+    integers = array('i')
+    integers.fromstring(data[offset:offset+count*4])
+    integers.byteswap()
+    return integers
+
+def check_labels(codel_grid,codels,block_count):
+    """Checks that the labels and sizes of a codel file fit its codels, so
+    that no label read from it points past the color blocks. Raises IOError
+    if they don't."""
+    labels = codel_grid.labels[:]
+    if labels and (min(labels) < -1 or max(labels) >= block_count):
+        raise IOError, "CODEL_FILE_INVALID"
+    #Every codel but white and black is in a block
+    colored = len(codels.translate(None,chr(colors.white_index)+chr(colors.black_index)))
+    if labels.count(-1) != len(codels)-colored or sum(codel_grid.sizes) != colored\
+        or (block_count > 0 and min(codel_grid.sizes) < 1):
+        raise IOError, "CODEL_FILE_INVALID"
+
+def load(path):
+    """Loads a codel file with mmap. Returns the CodelGrid, and its color
+    blocks if the file holds labels or None if it doesn't. The codels and
+    labels are read straight from the mapped file, which is mapped copy on
+    write so they can be changed without changing the file. The mapping is
+    kept as the grid's mapping, for callers that copy the codels out to
+    close. Raises IOError if the file is damaged."""
+    codel_file = open(path,"rb")
+    try:
+        data = mmap.mmap(codel_file.fileno(),0,access=mmap.ACCESS_COPY)
+    finally:
+        codel_file.close()
+    if len(data) < header_format.size:
+        raise IOError, "CODEL_FILE_TRUNCATED"
+    magic, version, flags, width, height, codel_size, block_count = header_format.unpack_from(data)
+    if magic != MAGIC or version != VERSION:
+        raise IOError, "NOT_A_CODEL_FILE"
+    count = width*height
+    offset = header_format.size
+    length = offset+padded(count)
+    if flags & HAS_LABELS:
+        length = length+4*(count+block_count+block_count*16)
+    if len(data) < length:
+        raise IOError, "CODEL_FILE_TRUNCATED"
+
+    if data[offset:offset+count].translate(None,palette_bytes):
+        #A byte that isn't a palette index
+        raise IOError, "CODEL_FILE_INVALID"
+
+    codel_grid = grid.CodelGrid(width,height,(ctypes.c_ubyte*count).from_buffer(data,offset))
+    codel_grid.codel_size = codel_size
+    codel_grid.mapping = data
+    if not flags & HAS_LABELS:
+        return (codel_grid, None)
+    codels = data[offset:offset+count]
+    offset = offset+padded(count)
+    codel_grid.labels = int_view(data,offset,count)
+    offset = offset+4*count
+    codel_grid.sizes = int_view(data,offset,block_count)
+    offset = offset+4*block_count
+    boundaries = int_view(data,offset,block_count*16)
+    check_labels(codel_grid,codels,block_count)
+    color_blocks = {}
+    for label in xrange(block_count):
+        color_block = grid.ColorBlock(codel_grid.sizes[label])
+        for dp in xrange(4):
+            for cc in xrange(2):
+                index = label*16+dp*4+cc*2
+                x, y = boundaries[index], boundaries[index+1]
+                if not (0 <= x < width and 0 <= y < height) or codel_grid.labels[y*width+x] != label:
+                    #A boundary pixel outside the grid or the block
+                    raise IOError, "CODEL_FILE_INVALID"
+                color_block.boundary_pixels[dp][cc] = (x, y)
+        color_blocks[label] = color_block
+    return (codel_grid, color_blocks)
+
+def save(path,codel_grid,color_blocks=None):
+    """Saves a grid as a codel file, with the labels of its color blocks if
+    they are given."""
+    count = codel_grid.width*codel_grid.height
+    flags = 0
+    block_count = 0
+    if color_blocks != None:
+        flags = HAS_LABELS
+        block_count = len(color_blocks)
+    codel_file = open(path,"wb")
+    try:
+        codel_file.write(header_format.pack(MAGIC,VERSION,flags,codel_grid.width,
+            codel_grid.height,codel_grid.codel_size,block_count))
+        codel_file.write(buffer(codel_grid.codels))
+        codel_file.write("\0"*(padded(count)-count))
+        if color_blocks != None:
+            boundaries = array('i')
+            for label in xrange(block_count):
+                for dp in xrange(4):
+                    for cc in xrange(2):
+                        boundaries.extend(color_blocks[label].boundary_pixels[dp][cc])
+            for integers in [array('i',codel_grid.labels),array('i',codel_grid.sizes),boundaries]:
+                if sys.byteorder != "little":
+                    integers.byteswap()
+                codel_file.write(integers.tostring())
+    finally:
+        codel_file.close()
+
+def export_image(image_path,path,codel_size=None,labels=False):
+    """Exports an image as a codel file, scaled down to one codel per cell.
+    The codel size is guessed from the image if it isn't given."""
+    image = PIL.Image.open(image_path)
+    if image.mode != "RGB":
+        image = image.convert("RGB")
+    image_grid = grid.from_image(image)
+    if codel_size == None:
+        codel_size = grid.detect_codel_size(image_grid)
+    codel_grid = grid.downsample(image_grid,codel_size)
+    color_blocks = None
+    if labels:
+        color_blocks = grid.label_blocks(codel_grid)
+    save(path,codel_grid,color_blocks)
+
+def print_usage():
+    """Prints usage string for command line."""
+    print "Piedit v0.0.1 - Python Piet IDE\n"
+    print "Usage: codelfile.py [<options>] <image filename> [<output filename>]"
+    print "Exports an image as a codel file. The output is written to the image filename with %s on the end by default." % (EXTENSION)
+    print "options:"
+    print "\t-h (--help)\t- Prints this help"
+    print "\t-c (--codel-size)\t- Sets the size of a codel in pixels. This is guessed from the image by default."
+    print "\t-l (--labels)\t- Saves the labels of the color blocks in the file, so they aren't worked out when it is run."
+
+#Export the image if on command line
+if __name__ == "__main__":
+    try:
+        opts,args = getopt.getopt(sys.argv[1:], "hc:l", ["help","codel-size=","labels"])
+    except getopt.GetoptError, err:
+        print str(err)
+        print_usage()
+        sys.exit(2)
+    codel_size = None
+    labels = False
+    for o,a in opts:
+        if o in ["-h","--help"]:
+            print_usage()
+            sys.exit(1)
+        elif o in ["-c","--codel-size"]:
+            codel_size = int(a)
+        elif o in ["-l","--labels"]:
+            labels = True
+    if len(args) not in [1,2]:
+        print_usage()
+        sys.exit(2)
+    if len(args) == 2:
+        output_path = args[1]
+    else:
+        output_path = os.path.splitext(args[0])[0]+EXTENSION
+    try:
+        export_image(args[0],output_path,codel_size,labels)
+    except IOError, err:
+        raise SystemExit("\nError: "+str(err))
@@ -39,15 +39,30 @@ for index,color in enumerate(colors):
 
 white = "#FFFFFF"
 black = "#000000"
+white_index = color_mappings[white]
+black_index = color_mappings[black]
 
 num_hues = 6
 num_lights = 3
 
+#Every channel of a piet color is one of 0x00, 0xC0 or 0xFF. Each channel is
+#mapped to a level of 0, 1 or 2 (3 for anything else) and the three levels are
+#packed into a 6 bit code, which indexes the palette lookup table.
+channel_levels = [3]*256
+channel_levels[0x00] = 0
+channel_levels[0xC0] = 1
+channel_levels[0xFF] = 2
+level_matrix = (16,4,1,0)
+
 def all_colors():
     """Generator to return all piet colors"""
     for color in colors:
         yield color
         
+def pack_rgb(rgb):
+    """Packs the channel levels of an rgb tuple into a 6 bit code"""
+    return channel_levels[rgb[0]]*16 + channel_levels[rgb[1]]*4 + channel_levels[rgb[2]]
+
 def rgb_to_hex(rgb):
     """Converts an rgb tuple to a hex string"""
     if len(rgb) <3:
@@ -58,29 +73,54 @@ def hex_to_rgb(hex):
     """Converts a hex string to an rgb tuple"""
     return (int(hex[1:3],16),int(hex[3:5],16),int(hex[5:7],16))
 
-def is_white(hex):
-    if hex == white:
-        return True
-    else:
-        try:
-            color_mappings[hex]
-            return False
-        except KeyError:
-            return True
-
-def is_black(hex):
-    if hex == black:
-        return True
-    else:
-        return False
-
-def hue_light_diff(from_color,to_color):
-    """Gets the difference in hue and light between two colors.
-    Expects a from_color and to_color in rgb tuple form"""
-    from_hue, from_light = divmod(color_mappings[from_color],num_lights)
-    to_hue, to_light = divmod(color_mappings[to_color],num_lights)
-    
-    #print "From Hue Light: %s,%s,%s, To Hue Light: %s,%s,%s" % (from_color,from_hue,from_light,to_color,to_hue,to_light)
+palette_rgb = tuple(hex_to_rgb(color) for color in colors)
+
+#Palette index of every packed rgb code. Unknown colors are treated as white.
+#Only the first 64 entries are used, the rest pad it out to a PIL lookup table
+packed_indices = bytearray([white_index])*256
+for index,rgb in enumerate(palette_rgb):
+    packed_indices[pack_rgb(rgb)] = index
+
+def rgb_to_index(rgb):
+    """Converts an rgb tuple to its index in the palette"""
+    return packed_indices[pack_rgb(rgb)]
+
+def image_to_indices(image):
+    """Converts a whole RGB or palette PIL image to a bytearray of palette
+    indices, one per pixel in row order. The lookups are done by PIL, not per
+    pixel in python"""
+    if image.mode == "P":
+        return palette_image_to_indices(image)
+    levels = image.point(channel_levels*3)
+    packed = levels.convert("L",level_matrix)
+    return bytearray(packed.point(list(packed_indices)).tobytes())
+
+def palette_image_to_indices(image):
+    """Converts a palette ("P" mode) PIL image to a bytearray of palette
+    indices. Only the palette of the image is looked up, and its indices are
+    translated in one go, with no RGB image made."""
+    palette = image.getpalette() or []
+    palette = palette + [0]*(768-len(palette))
+    lookup = bytearray(rgb_to_index(palette[i:i+3]) for i in xrange(0,768,3))
+    return bytearray(image.tobytes()).translate(lookup)
+
+#The palette as a flat list of channels, for saving palette images
+flat_palette = [channel for rgb in palette_rgb for channel in rgb]
+
+def is_white(index):
+    return index == white_index
+
+def is_black(index):
+    return index == black_index
+
+def op_code(hue_diff,light_diff):
+    """Gets the operation code for a change in hue and light"""
+    return hue_diff*num_lights + light_diff
+
+def hue_light_diff(from_index,to_index):
+    """Gets the difference in hue and light between two palette indices."""
+    from_hue, from_light = divmod(from_index,num_lights)
+    to_hue, to_light = divmod(to_index,num_lights)
     
     hue_diff, light_diff = to_hue - from_hue, to_light - from_light
     if hue_diff <0:
@@ -89,3 +129,10 @@ def hue_light_diff(from_color,to_color):
         light_diff = light_diff + num_lights
     
     return (hue_diff, light_diff)
+
+#Operation code for moving between every pair of palette indices, indexed
+#by [from][to]. None when either color is white or black
+transitions = [[None]*len(colors) for index in colors]
+for from_index in xrange(num_hues*num_lights):
+    for to_index in xrange(num_hues*num_lights):
+        transitions[from_index][to_index] = op_code(*hue_light_diff(from_index,to_index))
@@ -0,0 +1,277 @@
+#!/usr/bin/env python
+
+"""Compiler for the Piet programming language. Turns a program into a Python
+module that runs it without the image, PIL or piedit."""
+
+import sys
+import os.path
+import getopt
+import inspect
+import interpreter
+import transitions
+import colors
+import getchr
+import inputs
+import output
+
+__author__ = "Steven Anderson"
+__copyright__ = "Steven Anderson 2008"
+__credits__ = ["Steven Anderson"]
+__license__ = "GPL"
+__version__ = "0.0.1"
+__maintainer__ = "Steven Anderson"
+__email__ = "steven.james.anderson@googlemail.com"
+__status__ = "Production"
+
+#Code of the compiled module that runs the tables. The operations work as
+#those of the Interpreter.
+runtime = '''
+def run(max_steps=1000000,source=None,sink=None):
+    """Runs the program for at most max_steps steps of the interpreter, or
+    for ever if max_steps is -1. The input comes from the given Source, or
+    stdin, and the output goes to the given Sink, or stdout. The output is
+    flushed when the program stops."""
+    if source == None:
+        source = stdin_source()
+    if sink == None:
+        sink = StdoutSink()
+    try:
+        run_states(max_steps,source,sink)
+    finally:
+        sink.flush()
+
+def run_states(max_steps,source,sink):
+    """Runs the program from the start state."""
+    stack = []
+    state = start_state
+    step_count = start_steps
+    while state != -1:
+        steps = transition_steps[state]
+        if max_steps != -1 and step_count+steps > max_steps:
+            return
+        step_count = step_count+steps
+        op = operations[state]
+        next_state = next_states[state]
+        if op == 0:
+            if cycle_steps.has_key(state) and max_steps != -1:
+                #Skip the whole times round a cycle through white
+                cycles = (max_steps-step_count)//cycle_steps[state]
+                step_count = step_count+cycles*cycle_steps[state]
+        elif op == 1:
+            stack.append(push_values[state])
+        elif op == 2:
+            if len(stack) >= 1:
+                stack.pop()
+        elif op == 3:
+            if len(stack) >= 2:
+                item1 = stack.pop()
+                item2 = stack.pop()
+                stack.append(item1+item2)
+        elif op == 4:
+            if len(stack) >= 2:
+                top_item = stack.pop()
+                second_item = stack.pop()
+                stack.append(second_item-top_item)
+        elif op == 5:
+            if len(stack) >= 2:
+                item1 = stack.pop()
+                item2 = stack.pop()
+                stack.append(item1*item2)
+        elif op == 6:
+            if len(stack) >= 2:
+                top_item = stack.pop()
+                second_item = stack.pop()
+                stack.append(second_item/top_item)
+        elif op == 7:
+            if len(stack) >= 2:
+                top_item = stack.pop()
+                second_item = stack.pop()
+                stack.append(second_item % top_item)
+        elif op == 8:
+            if len(stack) >= 1:
+                item = stack.pop()
+                stack.append(int(not item))
+        elif op == 9:
+            if len(stack) >= 2:
+                top_item = stack.pop()
+                second_item = stack.pop()
+                stack.append(int(second_item>top_item))
+        elif op == 10:
+            if len(stack) >= 1:
+                item = stack.pop()
+                next_state = (next_state & ~6) | (((((next_state>>1)&3)+item)%4)<<1)
+        elif op == 11:
+            if len(stack) >= 1:
+                item = stack.pop()
+                if item%2 == 1:
+                    next_state = next_state ^ 1
+        elif op == 12:
+            if len(stack) >= 1:
+                stack.append(stack[-1])
+        elif op == 13:
+            if len(stack) >= 2:
+                num_rolls = stack.pop()
+                depth = stack.pop()
+                if depth > 0:
+                    roll(stack,depth,num_rolls)
+        elif op == 14:
+            #Whoever is typing the input should see the output asking for it
+            sink.flush()
+            number = source.read_number()
+            if number != None:
+                stack.append(number)
+        elif op == 15:
+            sink.flush()
+            char = source.read_char()
+            if char != None:
+                stack.append(ord(char))
+        elif op == 16:
+            if len(stack) >= 1:
+                sink.write(str(stack.pop()))
+        elif op == 17:
+            if len(stack) >= 1:
+                sink.write(chr(stack.pop()))
+        state = next_state
+
+def roll(stack,depth,num_rolls):
+    """Rolls the top depth items of the stack num_rolls times, in one rotation."""
+    if depth > len(stack):
+        depth = len(stack)
+    if depth == 0:
+        return
+    rolls = num_rolls % depth
+    if rolls:
+        stack[-depth:] = stack[-rolls:] + stack[-depth:-rolls]
+
+if __name__ == "__main__":
+    try:
+        opts,args = getopt.getopt(sys.argv[1:], "m:", ["maxsteps="])
+    except getopt.GetoptError, err:
+        print str(err)
+        print "Usage: %s [-m (--maxsteps) <steps>]" % (sys.argv[0])
+        sys.exit(2)
+    max_steps = 1000000
+    for o,a in opts:
+        if o in ["-m","--maxsteps"]:
+            max_steps = int(a)
+    try:
+        run(max_steps)
+    except KeyboardInterrupt:
+        print "\\n\\nTerminated"
+'''
+
+def compile_program(path,codel_size=None,jobs=1):
+    """Compiles the program at the given path. Returns the source of the
+    compiled module."""
+    program = interpreter.Interpreter(codel_size=codel_size,jobs=jobs)
+    program.run_program(path,start=False)
+    table = program.transition_table()
+
+    #Where the interpreter starts, at the top left codel
+    start_steps = 0
+    if program.grid.labels[0] != -1:
+        start_state = transitions.state_id(program.grid.labels[0],0,0)
+    elif colors.is_white(program.grid.codels[0]):
+        start_steps, codel, dp, cc, times_stopped, switch_cc, start_state = table.white_path(program.grid,0,0,0)
+        if start_state == transitions.FINISHED:
+            start_state = -1
+    else:
+        raise ValueError, "The program starts on a black codel"
+
+    count = len(table.next_states)
+    transition_steps = [0]*count
+    operations = [0]*count
+    push_values = [0]*count
+    next_states = [-1]*count
+    for state in xrange(count):
+        transition = table.resolve(state,through_cycles=True)
+        if transition == None:
+            continue
+        operations[state], transition_steps[state], next_states[state], position = transition
+        if operations[state] == 1:
+            push_values[state] = program.grid.sizes[state>>3]
+
+    lines = ['#!/usr/bin/env python',
+        '',
+        '"""%s, compiled from a Piet program by piedit. State IDs are color' % (os.path.basename(path)),
+        'block label*8 + DP*2 + CC."""',
+        '',
+        'import os',
+        'import sys',
+        'import getopt',
+        '',
+        'start_state = %d' % (start_state),
+        'start_steps = %d' % (start_steps),
+        '#Transitions from each state, through blocked tries and white',
+        format_list("transition_steps",transition_steps),
+        format_list("operations",operations),
+        format_list("push_values",push_values),
+        format_list("next_states",next_states),
+        '#Steps taken round each cycle through white, by state ID',
+        'cycle_steps = %r' % (table.cycle_steps),
+        '',
+        'READ_SIZE = %d' % (inputs.READ_SIZE),
+        'TERMINAL_EOF = %r' % (inputs.TERMINAL_EOF),
+        'BLOCK = %r' % (output.BLOCK),
+        'LINE = %r' % (output.LINE),
+        'UNBUFFERED = %r' % (output.UNBUFFERED),
+        'BUFFER_SIZE = %d' % (output.BUFFER_SIZE),
+        '']
+    #The input is read and the output buffered as the interpreter does it
+    for function in [getchr.get_chr_unix,getchr.get_chr_windows,getchr.get_chr,
+            inputs.Source,inputs.StreamSource,inputs.TerminalSource,inputs.stdin_source,
+            output.Sink,output.StreamSink,output.StdoutSink]:
+        lines.append(inspect.getsource(function))
+    return "\n".join(lines)+runtime
+
+def format_list(name,values):
+    """Formats a list of integers as a Python assignment, 16 to a line."""
+    lines = ["%s = [" % (name)]
+    for start in xrange(0,len(values),16):
+        lines.append("    "+", ".join(str(value) for value in values[start:start+16])+",")
+    lines.append("]")
+    return "\n".join(lines)
+
+def print_usage():
+    """Prints usage string for command line."""
+    print "Piedit v0.0.1 - Python Piet IDE\n"
+    print "Usage: compiler.py [<options>] <filename> [<output filename>]"
+    print "The output is written to the image filename with .py on the end by default."
+    print "options:"
+    print "\t-h (--help)\t- Prints this help"
+    print "\t-c (--codel-size)\t- Sets the size of a codel in pixels. This is guessed from the image by default."
+    print "\t-j (--jobs)\t- Sets the number of processes used to scan color blocks. This is 1 by default."
+
+#Compile the program if on command line
+if __name__ == "__main__":
+    interpreter.error_handler = interpreter.ErrorHandler(False)
+    try:
+        opts,args = getopt.getopt(sys.argv[1:], "hc:j:", ["help","codel-size=","jobs="])
+    except getopt.GetoptError, err:
+        print str(err)
+        print_usage()
+        sys.exit(2)
+    codel_size = None
+    jobs = 1
+    for o,a in opts:
+        if o in ["-h","--help"]:
+            print_usage()
+            sys.exit(1)
+        elif o in ["-c","--codel-size"]:
+            codel_size = int(a)
+        elif o in ["-j","--jobs"]:
+            jobs = int(a)
+    if len(args) not in [1,2]:
+        print_usage()
+        sys.exit(2)
+    if len(args) == 2:
+        output_path = args[1]
+    else:
+        output_path = os.path.splitext(args[0])[0]+".py"
+    try:
+        source = compile_program(args[0],codel_size,jobs)
+    except ValueError, err:
+        raise SystemExit("\nError: "+str(err))
+    output = open(output_path,"w")
+    output.write(source)
+    output.close()
@@ -1,8 +1,34 @@
-class Debug(object):
+"""Debug output of the interpreter, built on its Tracer"""
+
+import sys
+import tracing
+
+__author__ = "Steven Anderson"
+__copyright__ = "Steven Anderson 2008"
+__credits__ = ["Steven Anderson"]
+__license__ = "GPL"
+__version__ = "0.0.1"
+__maintainer__ = "Steven Anderson"
+__email__ = "steven.james.anderson@googlemail.com"
+__status__ = "Production"
+
+
+class Debug(tracing.Tracer):
+    """Tracer that prints every event as it happens while doit is set, as the
+    -d option of the interpreter and debugging in the UI do."""
 
     def __init__(self, doit):
+        """Initializes new Debug."""
+        tracing.Tracer.__init__(self)
         self.doit = doit
 
-    def writeln(self,msg=''):
-        if self.doit:
-            print msg
+    def get_doit(self):
+        return self.echo_level != tracing.OFF
+
+    def set_doit(self,doit):
+        if doit:
+            self.echo_to(sys.stdout)
+        else:
+            self.echo_to(None)
+
+    doit = property(get_doit,set_doit)
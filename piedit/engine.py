@@ -0,0 +1,211 @@
+"""Execution engines that run a Piet program faster than the step by step
+interpreter, giving exactly the same results"""
+
+import transitions
+import tracing
+
+__author__ = "Steven Anderson"
+__copyright__ = "Steven Anderson 2008"
+__credits__ = ["Steven Anderson"]
+__license__ = "GPL"
+__version__ = "0.0.1"
+__maintainer__ = "Steven Anderson"
+__email__ = "steven.james.anderson@googlemail.com"
+__status__ = "Production"
+
+#Operation codes the engines handle themselves
+PUSH = 1
+POINTER = 10
+SWITCH = 11
+
+#Most times round a compiled loop in one call, so a stopped thread is noticed
+MAX_ITERATIONS = 10000
+
+
+class TableEngine(object):
+    """Class that runs a program as lookups in its TransitionTable. Leaving a
+    color block takes two steps of the interpreter, one to move to the
+    boundary pixel and one to move out, so each lookup counts as two steps.
+    Getting round a blocked edge and going through white are one more
+    lookup each, which count the steps the interpreter would have taken.
+    The steps before max steps is reached that don't make up a whole
+    transition are left to the interpreter."""
+
+    def __init__(self,interpreter):
+        """Initializes new TableEngine, compiling the program of a loaded
+        interpreter."""
+        self.interpreter = interpreter
+        if interpreter.lazy_blocks != None:
+            #Only the blocks the program can reach are put in the table
+            x,y = interpreter.current_pixel_coords
+            interpreter.lazy_blocks.label_reachable(y*interpreter.width+x)
+        self.table = interpreter.transition_table()
+        if interpreter.debug.level:
+            for cycle in self.table.white_cycles:
+                x, y = self.table.exits[cycle[0]]%interpreter.width, self.table.exits[cycle[0]]//interpreter.width
+                interpreter.debug.event(tracing.WHITE_CYCLE,interpreter.current_step,x,y)
+
+    def run(self):
+        """Runs the program until it finishes or max steps is reached."""
+        interpreter = self.interpreter
+        while not interpreter.finished and not self.out_of_steps():
+            if interpreter.step == 0 and self.in_color_block():
+                self.run_table()
+                if interpreter.finished or self.out_of_steps():
+                    return
+            interpreter.do_next_step()
+
+    def out_of_steps(self):
+        """Tells us whether the interpreter has done max steps."""
+        max_steps = self.interpreter.max_steps
+        return max_steps != -1 and self.interpreter.current_step >= max_steps
+
+    def in_color_block(self):
+        """Tells us whether the interpreter is in a block that isn't white or black."""
+        x,y = self.interpreter.current_pixel_coords
+        return self.interpreter.grid.labels[y*self.interpreter.width+x] != -1
+
+    def run_table(self):
+        """Runs transitions from the table for as long as the interpreter stays
+        in color blocks, then hands the interpreter back in the state the
+        step by step interpreter would have left it in."""
+        interpreter = self.interpreter
+        next_states = self.table.next_states
+        exits = self.table.exits
+        entries = self.table.entries
+        ops = self.table.ops
+        retry_states = self.table.retry_states
+        retry_steps = self.table.retry_steps
+        white_paths = self.table.white_paths
+        cycle_steps = self.table.cycle_steps
+        find_path = self.find_path
+        operations = interpreter.operations
+        stack = interpreter.stack
+        write = interpreter.output.write
+        sizes = interpreter.grid.sizes
+        thread = interpreter.thread
+        if interpreter.max_steps == -1:
+            last_step = float("inf")
+        else:
+            last_step = interpreter.max_steps-2
+
+        if interpreter.times_stopped != 0 or not interpreter.switch_cc:
+            #The interpreter is part way round a blocked edge
+            return
+        step_count = interpreter.current_step
+        times_stopped = 0
+        switch_cc = True
+        x,y = interpreter.current_pixel_coords
+        position = y*interpreter.width+x
+        state = transitions.state_id(interpreter.grid.labels[position],interpreter.dp,interpreter.cc)
+        finished = False
+        skip_path = False
+        while step_count <= last_step:
+            if thread != None and thread.should_stop:
+                break
+            if find_path != None:
+                path = find_path(state)
+                if path != None and not skip_path:
+                    length = len(path.steps)-1
+                    if path.loop:
+                        iterations = path.max_iterations
+                        if interpreter.max_steps != -1:
+                            #Dividing the infinite last step gives nan
+                            iterations = min((last_step+2-step_count)//path.steps[-1],iterations)
+                    elif step_count+path.steps[-1] <= last_step+2:
+                        iterations = 1
+                    else:
+                        iterations = 0
+                    if iterations:
+                        path.entered = path.entered + 1
+                        done = path.function(stack,iterations,write)
+                        if done != 0:
+                            rounds, round_done = divmod(done,length)
+                            step_count = step_count + rounds*path.steps[-1] + path.steps[round_done]
+                            position = path.positions[round_done or length]
+                            state = path.states[round_done or length]
+                        #The transition a path stops before is done from the table
+                        skip_path = done < iterations*length
+                        if skip_path:
+                            path.exited = path.exited + 1
+                        continue
+            skip_path = False
+            next_state = next_states[state]
+            if next_state == transitions.BLOCKED:
+                retry_state = retry_states[state]
+                if step_count+retry_steps[state] > last_step:
+                    break
+                step_count = step_count + retry_steps[state]
+                if retry_state == transitions.FINISHED:
+                    #The last try is with the DP rotated three times
+                    state = (state & ~6) | ((state+6) & 6)
+                    position = exits[state]
+                    times_stopped = 8
+                    switch_cc = False
+                    finished = True
+                    break
+                times_stopped = retry_steps[state]//2
+                switch_cc = times_stopped%2 == 0
+                state = retry_state
+                next_state = next_states[state]
+            step_count = step_count + 2
+            if next_state == transitions.WHITE:
+                steps, position, dp, cc, times_stopped, switch_cc, next_state = white_paths[state]
+                if step_count+steps > last_step+2:
+                    #Leave the interpreter at the start of the white
+                    position = entries[state]
+                    times_stopped = 0
+                    switch_cc = True
+                    break
+                step_count = step_count + steps
+                if next_state == transitions.FINISHED:
+                    state = transitions.state_id(0,dp,cc)
+                    finished = True
+                    break
+                if cycle_steps.has_key(state) and interpreter.max_steps != -1:
+                    #Skip the whole times round a cycle that does nothing
+                    cycles = (last_step+2-step_count)//cycle_steps[state]
+                    step_count = step_count + cycles*cycle_steps[state]
+                state = next_state
+                continue
+
+            op = ops[state]
+            try:
+                if op == PUSH:
+                    stack.append(sizes[state>>3])
+                elif op == POINTER or op == SWITCH:
+                    interpreter.dp, interpreter.cc = (next_state>>1)&3, next_state&1
+                    operations[op][1]()
+                    next_state = (next_state & ~7) | interpreter.dp*2 | interpreter.cc
+                elif op:
+                    operations[op][1]()
+            except:
+                #Stop where the interpreter would have stopped
+                self.sync(state,exits[state],step_count,times_stopped,switch_cc)
+                raise
+            position = entries[state]
+            times_stopped = 0
+            switch_cc = True
+            state = next_state
+        self.sync(state,position,step_count,times_stopped,switch_cc)
+        if finished:
+            interpreter.stop_execution()
+
+    #Engines that compile paths override this with a method that gets the
+    #compiled Path starting from a state, or None
+    find_path = None
+
+    def stats(self):
+        """Gets the statistics of the engine as a list of (name, value) pairs."""
+        return [("Color block states", len(self.table.next_states)),
+            ("White cycles", len(self.table.white_cycles))]
+
+    def sync(self,state,position,step_count,times_stopped,switch_cc):
+        """Puts the state of the engine back into the interpreter."""
+        interpreter = self.interpreter
+        label, interpreter.dp, interpreter.cc = transitions.split_state(state)
+        interpreter.current_pixel_coords = (position%interpreter.width, position//interpreter.width)
+        interpreter.current_step = step_count
+        interpreter.times_stopped = times_stopped
+        interpreter.switch_cc = switch_cc
+        interpreter.step = 0
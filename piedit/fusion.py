@@ -0,0 +1,99 @@
+"""Compiles straight paths through a Piet program into Python functions"""
+
+import engine
+import codegen
+
+__author__ = "Steven Anderson"
+__copyright__ = "Steven Anderson 2008"
+__credits__ = ["Steven Anderson"]
+__license__ = "GPL"
+__version__ = "0.0.1"
+__maintainer__ = "Steven Anderson"
+__email__ = "steven.james.anderson@googlemail.com"
+__status__ = "Production"
+
+#Most transitions put in one path
+MAX_PATH_LENGTH = 64
+
+
+class Path(object):
+    """Class that represents a path of transitions compiled into a function.
+    The function takes the stack and the number of iterations, and returns
+    the number of transitions done. The states, steps and positions are those
+    after each number of transitions, starting from none. A path that loops
+    ends in the state it starts from, and may be gone round many times. Reads
+    is the number of items the path reads from the stack it is given."""
+
+    def __init__(self,function,states,steps,positions,loop=False,reads=0):
+        """Initializes new Path."""
+        self.function = function
+        self.states = states
+        self.steps = steps
+        self.positions = positions
+        self.loop = loop
+        self.reads = reads
+        #Most times round the loop in one call
+        self.max_iterations = engine.MAX_ITERATIONS
+        #Times the function was called, and times it stopped early
+        self.entered = 0
+        self.exited = 0
+
+
+class FusedEngine(engine.TableEngine):
+    """Class that runs a program like the TableEngine, but where the program
+    goes from block to block without branching, the operations on the way
+    are done by one generated function. A path ends at a Pointer or Switch,
+    which branch, at a Roll or input, which have a stack effect that can't be
+    known before they are done, and where the program ends."""
+
+    def __init__(self,interpreter):
+        """Initializes new FusedEngine."""
+        engine.TableEngine.__init__(self,interpreter)
+        #Compiled paths by start state, None where there is no path
+        self.paths = {}
+
+    def find_path(self,state):
+        """Gets the compiled path starting from a state, compiling it the
+        first time the state is reached."""
+        if not self.paths.has_key(state):
+            self.paths[state] = self.compile_path(state)
+        return self.paths[state]
+
+    def compile_path(self,start):
+        """Finds the longest straight path starting from a state and compiles
+        it. Returns None if there are less than two transitions to put in it."""
+        states = [start]
+        steps = [0]
+        positions = [None]
+        code = codegen.StraightLine("path_%d" % (start))
+        state = start
+        while len(states) <= MAX_PATH_LENGTH:
+            transition = self.straight_transition(state)
+            if transition == None:
+                break
+            op, transition_steps, state, position = transition
+            code.add_op(op,self.interpreter.grid.sizes[states[-1]>>3])
+            states.append(state)
+            steps.append(steps[-1]+transition_steps)
+            positions.append(position)
+            if state in states[:-1]:
+                break
+        if len(states) < 3:
+            return None
+        return Path(code.compile(),states,steps,positions,reads=code.taken)
+
+    def straight_transition(self,state):
+        """Gets the (operation, steps, next state, codel entered) of the
+        transition from a state, or None if it can't be put in a path."""
+        transition = self.table.resolve(state)
+        if transition == None or transition[0] not in codegen.STRAIGHT_OPS:
+            return None
+        return transition
+
+    def stats(self):
+        """Gets the statistics of the engine as a list of (name, value) pairs."""
+        paths = [path for path in self.paths.values() if path != None]
+        return engine.TableEngine.stats(self) + [
+            ("Paths compiled", len(paths)),
+            ("Paths entered", sum(path.entered for path in paths)),
+            ("Paths exited early", sum(path.exited for path in paths))]
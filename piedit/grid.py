@@ -0,0 +1,219 @@
+"""Compact codel grid for the piet interpreter"""
+
+import re
+import fractions
+import itertools
+from array import array
+import colors
+import unionfind
+
+__author__ = "Steven Anderson"
+__copyright__ = "Steven Anderson 2008"
+__credits__ = ["Steven Anderson"]
+__license__ = "GPL"
+__version__ = "0.0.1"
+__maintainer__ = "Steven Anderson"
+__email__ = "steven.james.anderson@googlemail.com"
+__status__ = "Production"
+
+
+class CodelGrid(object):
+    """Class that holds the codels of a Piet program in flat buffers instead
+    of one object per codel. Everything is stored row by row, so the codel at
+    (x,y) lives at index y*width+x."""
+
+    def __init__(self,width,height,codels):
+        """Initializes new CodelGrid from a buffer of palette indices."""
+        self.width = width
+        self.height = height
+        #Palette index of each codel
+        self.codels = codels
+        #Color block label of each codel, -1 for white and black
+        self.labels = array('i',[-1])*(width*height)
+        #Size of each color block, indexed by label
+        self.sizes = array('i')
+        #Number of image pixels along the side of each codel
+        self.codel_size = 1
+        #Mapped file the buffers are read from, if they are
+        self.mapping = None
+
+    def rows(self):
+        """Generator to return each row of codels as a string. The codels
+        are copied to a bytearray first, as a slice of a mapped ctypes
+        array is a list."""
+        for y in xrange(self.height):
+            yield str(bytearray(self.codels[y*self.width:(y+1)*self.width]))
+
+    def columns(self):
+        """Generator to return each column of codels as a string."""
+        for x in xrange(self.width):
+            yield str(bytearray(self.codels[x::self.width]))
+
+#Matches a run of one color
+run_pattern = re.compile(r"(.)\1*",re.S)
+
+
+class ColorBlock(object):
+    """Class that represents a color block in a Piet program."""
+    def __init__(self,size):
+        """Initializes new ColorBlock."""
+        self.size = size
+        #boundary_pixels = [[DPR_CCL,DPR_CCR],[DPD_CCL,DPD,CCR] ... etc.
+        self.boundary_pixels = [[None,None] for i in xrange(4)]
+        
+    def update_boundaries(self,x,y):
+        """Updates the boundary pixels of the current color block given the
+        coordinates of a new pixel. Pixels must be given in row order."""
+        pixel = (x,y)
+        #If a new maximum (right, left)
+        if self.boundary_pixels[0][0] == None or x > self.boundary_pixels[0][0][0]:
+            self.boundary_pixels[0][0] = pixel
+            
+        #If a new maximum (right, right)
+        if self.boundary_pixels[0][1] == None or x >= self.boundary_pixels[0][1][0]:
+            self.boundary_pixels[0][1] = pixel
+            
+        #If a new maximum (down, right)
+        if self.boundary_pixels[1][1] == None or y > self.boundary_pixels[1][1][1]:
+            self.boundary_pixels[1][1]= pixel
+        
+        #If a new maximum (down, left)
+        if self.boundary_pixels[1][0] == None or y >= self.boundary_pixels[1][0][1]:
+            self.boundary_pixels[1][0] = pixel
+            
+        #If a new maximum (left, right)
+        if self.boundary_pixels[2][1] == None or x < self.boundary_pixels[2][1][0]:
+            self.boundary_pixels[2][1] = pixel
+        
+        #If a new maximum (left, left)
+        if self.boundary_pixels[2][0] == None or x <= self.boundary_pixels[2][0][0]:
+            self.boundary_pixels[2][0] = pixel
+            
+        #If a new maximum (up,left)
+        if self.boundary_pixels[3][0] == None:
+            self.boundary_pixels[3][0] = pixel
+            
+        #If a new maximum (up,right)
+        if self.boundary_pixels[3][1] == None or y == self.boundary_pixels[3][1][1]:
+            self.boundary_pixels[3][1] = pixel
+
+    def merge(self,other):
+        """Merges in the size and boundary pixels of another part of the same
+        color block that comes later in row order."""
+        self.size = self.size + other.size
+        pixels = set(pixel for bounds in other.boundary_pixels for pixel in bounds)
+        for x,y in sorted(pixels,key=lambda pixel: (pixel[1],pixel[0])):
+            self.update_boundaries(x,y)
+
+
+
+def from_image(image):
+    """Builds a CodelGrid from an RGB PIL image."""
+    (width, height) = image.size
+    return CodelGrid(width,height,colors.image_to_indices(image))
+
+def from_pixels(pixels,width,height):
+    """Builds a CodelGrid from a flat sequence of palette indices, as used by
+    the UI. The pixels are copied so the UI can carry on editing."""
+    return CodelGrid(width,height,bytearray(pixels))
+
+def detect_codel_size(grid):
+    """Guesses the codel size of a grid from the greatest common divisor of
+    the lengths of all its horizontal and vertical runs of one color."""
+    codel_size = 0
+    for line in itertools.chain(grid.rows(),grid.columns()):
+        for run in run_pattern.finditer(line):
+            codel_size = fractions.gcd(codel_size,run.end()-run.start())
+            if codel_size == 1:
+                return 1
+    return max(codel_size,1)
+
+def downsample(grid,codel_size):
+    """Builds a grid with one cell per codel from a grid drawn with codels
+    codel_size pixels wide. Partial codels at the right and bottom edges are
+    dropped."""
+    if codel_size == 1:
+        return grid
+    width = grid.width//codel_size
+    height = grid.height//codel_size
+    codels = bytearray()
+    for y in xrange(height):
+        start = y*codel_size*grid.width
+        codels.extend(grid.codels[start:start+width*codel_size:codel_size])
+    scaled = CodelGrid(width,height,codels)
+    scaled.codel_size = codel_size*grid.codel_size
+    return scaled
+
+def label_blocks(grid):
+    """Labels the color blocks of a grid, filling in its labels and sizes.
+    Returns the ColorBlock objects indexed by label.
+    
+    Pass 1 finds the runs of one color in each row and unions every run with
+    the runs of the same color that touch it in the row above. Pass 2 gives
+    each set of runs its final label, in the order the blocks are first met
+    in the image. The work done is in proportion to the number of runs."""
+    runs = find_runs(grid.codels,grid.width,0,grid.height)
+    grid.sizes, color_blocks = assign_labels(runs,grid.width,grid.labels)
+    return color_blocks
+
+def find_runs(codels,width,first_row,last_row):
+    """Pass 1 of the labeler over the rows first_row to last_row-1. Returns
+    the start, end and label of every run that isn't white or black, and the
+    UnionFind joining the labels of touching runs."""
+    sets = unionfind.UnionFind()
+    run_starts = array('i')
+    run_ends = array('i')
+    run_labels = array('i')
+    firsts = array('i')
+    seconds = array('i')
+    
+    above = (0,0)
+    for y in xrange(first_row,last_row):
+        row_start = len(run_starts)
+        above_run, above_end = above
+        for run in run_pattern.finditer(buffer(codels,y*width,width)):
+            color = ord(run.group(1))
+            if colors.is_white(color) or colors.is_black(color):
+                continue
+            start, end = run.span()
+            start, end = y*width+start, y*width+end
+            label = sets.add()
+            run_starts.append(start)
+            run_ends.append(end)
+            run_labels.append(label)
+            #Union with the runs above that overlap this one
+            while above_run < above_end and run_ends[above_run]+width <= start:
+                above_run = above_run + 1
+            touching = above_run
+            while touching < above_end and run_starts[touching]+width < end:
+                if codels[run_starts[touching]] == color:
+                    firsts.append(run_labels[touching])
+                    seconds.append(label)
+                touching = touching + 1
+        above = (row_start,len(run_starts))
+    sets.union_pairs(firsts,seconds)
+    return (run_starts, run_ends, run_labels, sets)
+
+def assign_labels(runs,width,labels):
+    """Pass 2 of the labeler. Writes the final label of every run found by
+    find_runs into labels. Returns the block sizes and ColorBlock objects."""
+    run_starts, run_ends, run_labels, sets = runs
+    roots = sets.roots()
+    final_labels = array('i',[-1])*len(roots)
+    sizes = array('i')
+    color_blocks = {}
+    for start,end,label in itertools.izip(run_starts,run_ends,run_labels):
+        root = roots[label]
+        if final_labels[root] == -1:
+            final_labels[root] = len(sizes)
+            sizes.append(0)
+            color_blocks[final_labels[root]] = ColorBlock(0)
+        label = final_labels[root]
+        labels[start:end] = array('i',[label])*(end-start)
+        sizes[label] = sizes[label] + end-start
+        y, x = divmod(start,width)
+        color_blocks[label].update_boundaries(x,y)
+        color_blocks[label].update_boundaries(x+end-start-1,y)
+    for label,color_block in color_blocks.items():
+        color_block.size = sizes[label]
+    return (sizes, color_blocks)
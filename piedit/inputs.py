@@ -0,0 +1,151 @@
+"""Places the input of a Piet program can come from, and how it is read"""
+
+import os
+import sys
+from getchr import get_chr
+
+__author__ = "Steven Anderson"
+__copyright__ = "Steven Anderson 2008"
+__credits__ = ["Steven Anderson"]
+__license__ = "GPL"
+__version__ = "0.0.1"
+__maintainer__ = "Steven Anderson"
+__email__ = "steven.james.anderson@googlemail.com"
+__status__ = "Production"
+
+#Most characters read from a pipe or file at once
+READ_SIZE = 8192
+#Character typed to end the input at a raw terminal, Ctrl-D
+TERMINAL_EOF = "\x04"
+
+
+class Source(object):
+    """Base class of the places input comes from. Characters are read into a
+    buffer by fill, and taken from it by IN(Char) and IN(Number). At the end
+    of the input both read nothing, so the operation pushes nothing."""
+
+    def __init__(self):
+        """Initializes new Source."""
+        self.buffer = ""
+        self.position = 0
+        self.eof = False
+
+    def peek(self,ahead=0):
+        """Gets the character the given number of places after the next one
+        without taking it, or None if the input ends before it."""
+        while self.position+ahead >= len(self.buffer):
+            if self.eof:
+                return None
+            data = self.fill()
+            if data == "":
+                self.eof = True
+                return None
+            #Keep what hasn't been taken yet
+            self.buffer = self.buffer[self.position:]+data
+            self.position = 0
+        return self.buffer[self.position+ahead]
+
+    def read_char(self):
+        """Takes the next character, or None at the end of the input."""
+        char = self.peek()
+        if char != None:
+            self.position = self.position + 1
+        return char
+
+    def read_number(self):
+        """Takes a number: any whitespace, then an optional sign and digits.
+        Only the whitespace and the number are taken, so whatever ends the
+        number is left for the next read. If there is no number after the
+        whitespace, nothing more is taken and None is returned, as it is at
+        the end of the input."""
+        char = self.peek()
+        while char != None and char.isspace():
+            self.position = self.position + 1
+            char = self.peek()
+        sign = 0
+        if char in ["-","+"]:
+            sign = 1
+        length = sign
+        char = self.peek(length)
+        while char != None and char.isdigit():
+            length = length + 1
+            char = self.peek(length)
+        if length == sign:
+            return None
+        number = int(self.buffer[self.position:self.position+length])
+        self.position = self.position + length
+        return number
+
+    def fill(self):
+        """Gets more input, or an empty string at the end of it. Subclasses
+        must override it."""
+        raise NotImplementedError
+
+    def close(self):
+        """Closes what the source reads from if it opened it."""
+        pass
+
+
+class StreamSource(Source):
+    """Source that reads a file-like object, such as a pipe or a file, a
+    buffer at a time. Data is read from the file descriptor when there is
+    one, which returns what is there instead of waiting for a whole
+    buffer."""
+
+    def __init__(self,stream,buffer_size=READ_SIZE):
+        """Initializes new StreamSource."""
+        Source.__init__(self)
+        self.stream = stream
+        self.buffer_size = buffer_size
+
+    def fill(self):
+        try:
+            fd = self.stream.fileno()
+        except (AttributeError,IOError):
+            return self.stream.read(self.buffer_size)
+        return os.read(fd,self.buffer_size)
+
+
+class FileSource(StreamSource):
+    """Source that reads a file it opens at the given path."""
+
+    def __init__(self,path,buffer_size=READ_SIZE):
+        """Initializes new FileSource."""
+        StreamSource.__init__(self,open(path,"rb"),buffer_size)
+
+    def close(self):
+        self.stream.close()
+
+
+class MemorySource(Source):
+    """Source that reads the given string, for callers that have the input
+    already."""
+
+    def __init__(self,data):
+        """Initializes new MemorySource."""
+        Source.__init__(self)
+        self.data = data
+
+    def fill(self):
+        data = self.data
+        self.data = ""
+        return data
+
+
+class TerminalSource(Source):
+    """Source that reads a key at a time from a terminal in raw mode, so the
+    program gets each key as it is pressed. Ctrl-D ends the input."""
+
+    def fill(self):
+        char = get_chr()
+        if char == TERMINAL_EOF:
+            return ""
+        return char
+
+
+def stdin_source():
+    """Gets the source to read stdin with: a terminal one if it is a
+    terminal, and a buffered one otherwise."""
+    if hasattr(sys.stdin,"isatty") and sys.stdin.isatty():
+        return TerminalSource()
+    return StreamSource(sys.stdin)
@@ -7,9 +7,22 @@ import sys
 import getopt
 import PIL.Image
 import colors
-import unionfind
-import getchr
+import grid
+import tiles
+import engine
+import fusion
+import jit
+import memo
+import lazy
+import stack
+import output
+import quantize
+import cache
+import codelfile
+import transitions
+import inputs
 import debug
+import tracing
 
 __author__ = "Steven Anderson"
 __copyright__ = "Steven Anderson 2008"
@@ -23,9 +36,37 @@ __status__ = "Production"
 
 class Interpreter(object):
     """The Piet interpreter class"""
-    def __init__(self, max_steps=1000000, thread=None):
-        """Initalizes new Interpreter."""
-        self.current_pixel = None
+    def __init__(self, max_steps=1000000, thread=None, codel_size=None, jobs=1):
+        """Initalizes new Interpreter. The codel size is guessed from the
+        image if it isn't given. Color blocks are labeled by jobs processes."""
+        self.grid = None
+        self.codel_size = codel_size
+        self.jobs = jobs
+        #Labels color blocks as execution reaches them instead of up front
+        self.lazy = False
+        self.lazy_blocks = None
+        #Directory compiled programs are cached in, None for no cache. Only
+        #a directory no one else can write to should be given, as the
+        #entries are unpickled.
+        self.cache_dir = None
+        self.clear_cache = False
+        #How pixels that aren't Piet colors, and transparent pixels, are
+        #mapped to Piet colors when an image is loaded
+        self.unknown_colors = quantize.WHITE
+        self.tolerance = 0
+        self.alpha = quantize.IGNORE
+        #Pixels of the image that weren't exactly a Piet color
+        self.remapped = 0
+        #TransitionTable of the program, compiled when an engine needs it
+        self.table = None
+        #"step" runs one step at a time, "table" uses a compiled TransitionTable
+        #"fused" also compiles straight paths into Python functions and "jit"
+        #compiles the loops the program spends its time in
+        self.engine = "step"
+        self.show_stats = False
+        #Statistics of the engine, as (name, value) pairs
+        self.stats = []
+        self.current_pixel_coords = None
         self.dp = 0
         self.cc = 0
         self.switch_cc = True
@@ -33,31 +74,39 @@ class Interpreter(object):
         self.times_stopped = 0
         self.max_steps = max_steps
         self.current_step = 0
-        self.stack = []
+        self.stack = stack.Stack()
+        #Sink the output of the program goes to
+        self.output = output.StdoutSink()
+        #Source the input of the program comes from
+        self.input = inputs.stdin_source()
         self.color_blocks = {}
         self.finished = False
         self.thread = thread
         self.debug = debug.Debug(False)
-        #Indexed by hue and light change
-        self.operations = {
-            (1,0):("Add",self.op_add),
-            (2,0):("Divide",self.op_divide),
-            (3,0):("Greater",self.op_greater),
-            (4,0):("Duplicate",self.op_duplicate),
-            (5,0):("IN(char)",self.op_in_char),
-            (0,1):("Push",self.op_push),
-            (1,1):("Subtract",self.op_subtract),
-            (2,1):("Mod",self.op_mod),
-            (3,1):("Pointer",self.op_pointer),
-            (4,1):("Roll",self.op_roll),
-            (5,1):("OUT(Number)",self.op_out_number),
-            (0,2):("Pop",self.op_pop),
-            (1,2):("Multiply",self.op_multiply),
-            (2,2):("Not",self.op_not),
-            (3,2):("Switch",self.op_switch),
-            (4,2):("IN(Number)",self.op_in_number),
-            (5,2):("OUT(Char)",self.op_out_char),
-        }
+        #File the events of the trace are saved in, and the level of them
+        self.trace_path = None
+        self.trace_level = tracing.ALL
+        #Indexed by operation code (hue change*3 + light change)
+        self.operations = [
+            None,
+            ("Push",self.op_push),
+            ("Pop",self.op_pop),
+            ("Add",self.op_add),
+            ("Subtract",self.op_subtract),
+            ("Multiply",self.op_multiply),
+            ("Divide",self.op_divide),
+            ("Mod",self.op_mod),
+            ("Not",self.op_not),
+            ("Greater",self.op_greater),
+            ("Pointer",self.op_pointer),
+            ("Switch",self.op_switch),
+            ("Duplicate",self.op_duplicate),
+            ("Roll",self.op_roll),
+            ("IN(Number)",self.op_in_number),
+            ("IN(char)",self.op_in_char),
+            ("OUT(Number)",self.op_out_number),
+            ("OUT(Char)",self.op_out_char),
+        ]
     
     def init(self):
         self.__init__()
@@ -65,135 +114,214 @@ class Interpreter(object):
     def set_opt(self,o,a):
         """Sets an option from the command line."""
         if o in ["-d", "--debug"]:
-            self.debug.DEBUG = True
+            self.debug.doit = True
+            #Keep the output in order with the debug information
+            self.output.mode = output.UNBUFFERED
+        elif o == "--trace":
+            self.trace_path = a
+            self.debug.record(self.trace_level)
+        elif o == "--trace-level":
+            self.trace_level = int(a)
+            if self.trace_path != None:
+                self.debug.record(self.trace_level)
         elif o in ["-m","--maxsteps"]:
             self.max_steps = int(a)
+        elif o in ["-c","--codel-size"]:
+            self.codel_size = int(a)
+        elif o in ["-j","--jobs"]:
+            self.jobs = int(a)
+        elif o in ["-e","--engine"]:
+            if a != "step" and not engines.has_key(a):
+                error_handler.handle_error("Unknown engine %s" % (a))
+            self.engine = a
+        elif o in ["-s","--stats"]:
+            self.show_stats = True
+        elif o in ["-l","--lazy"]:
+            self.lazy = True
+        elif o == "--unknown":
+            if a not in quantize.policies:
+                error_handler.handle_error("Unknown color policy %s" % (a))
+            self.unknown_colors = a
+        elif o == "--tolerance":
+            self.tolerance = int(a)
+        elif o == "--alpha":
+            if a not in quantize.alpha_policies:
+                error_handler.handle_error("Unknown alpha policy %s" % (a))
+            self.alpha = a
+        elif o in ["-o","--output"]:
+            self.output = output.FileSink(a,self.output.mode)
+        elif o in ["-i","--input"]:
+            self.input = inputs.FileSource(a)
+        elif o in ["-b","--buffering"]:
+            if a not in output.modes:
+                error_handler.handle_error("Unknown buffering %s" % (a))
+            self.output.mode = a
+        elif o == "--cache-dir":
+            self.cache_dir = a
+        elif o == "--clear-cache":
+            self.clear_cache = True
     
-    def run_program(self,path=None,pixels=None,width=None,height=None,start=True):
-        """Runs a program at the given path."""
-        self.debug.writeln("---LOADING IMAGE %s...---" % (path))
-        if pixels != None:
-            self.width = width
-            self.height = height
-            self.pixels = [[Pixel(x,y,pixels[y*(self.width)+x]) for y in xrange(self.height)] for x in xrange(self.width)]
-            self.current_pixel = self.pixels[0][0]
+    def run_program(self,path=None,pixels=None,width=None,height=None,start=True,block_index=None):
+        """Runs a program at the given path, which may be an image or a codel
+        file. A program being edited in the UI can be given as pixels, or as
+        a BlockIndex that has its color blocks labeled already. Its codel
+        size is always 1."""
+        if self.debug.level:
+            self.debug.event(tracing.LOADING,0,self.debug.string(str(path)))
+        color_blocks = None
+        self.table = None
+        if block_index != None:
+            (self.grid, color_blocks) = block_index.snapshot()
+            #Each pixel of the editor is a codel, so there is nothing to
+            #detect or scale and the labels of the index can be used
+            self.codel_size = 1
+        elif pixels != None:
+            self.grid = grid.from_pixels(pixels,width,height)
+            self.codel_size = 1
+        elif codelfile.is_codel_file(path):
+            (self.grid, color_blocks) = codelfile.load(path)
+            if self.codel_size == None:
+                #The codels are stored one per cell already
+                self.codel_size = 1
         else:
             self.load_image(path)   
-        self.debug.writeln("---IMAGE LOADED---\n")
-        self.debug.writeln("---SCANNING COLOR BLOCKS---")
-        self.find_color_blocks()
-        self.debug.writeln("---COLOR BLOCKS SCANNED---\n")
-        self.debug.writeln("---STARTING EXECUTION---")
-        self.debug.writeln("AT (%s,%s), COLOR=%s, DP=%d, CC=%s"\
-            % (self.current_pixel.x,self.current_pixel.y,self.current_pixel.color,\
-            self.dp, self.cc))
+        labeled_grid = self.grid
+        self.scale_grid()
+        if self.grid is not labeled_grid:
+            #The codels were scaled, so the labels no longer fit
+            color_blocks = None
+        (self.width, self.height) = (self.grid.width, self.grid.height)
+        self.current_pixel_coords = (0,0)
+        if self.debug.level:
+            self.debug.event(tracing.LOADED,0,self.codel_size)
+            self.debug.event(tracing.SCANNING,0)
+        self.find_color_blocks(color_blocks)
+        if self.debug.level:
+            self.debug.event(tracing.SCANNED,0)
+            self.debug.event(tracing.STARTING,0)
+            self.trace_position()
         if start:
             self.start_execution()
         else:
             pass
         
     def load_image(self,path):
-        """Loads an image and puts pixel data into self.pixels."""
+        """Loads an image and puts its codels into self.grid. Unless the
+        default policies are set, every pixel is mapped to a Piet color by
+        quantize, which counts the pixels it remaps."""
+        self.remapped = 0
         try:
             self.image = PIL.Image.open(path)
-            if self.image.mode != "RGB":
-                self.image = self.image.convert("RGB")
+            if quantize.is_default(self.unknown_colors,self.tolerance,self.alpha):
+                if self.image.mode not in ["RGB","P"]:
+                    self.image = self.image.convert("RGB")
+            else:
+                self.image.load()
         except IOError:
             raise IOError, "IMAGE_NOT_LOADED"
         
-        (self.width, self.height) = self.image.size
-        rawpixels = self.image.getdata()
-        self.pixels = [[Pixel(x,y,colors.rgb_to_hex(rawpixels[y*(self.width)+x])) for y in xrange(self.height)] for x in xrange(self.width)]
-        self.current_pixel = self.pixels[0][0]
+        if quantize.is_default(self.unknown_colors,self.tolerance,self.alpha):
+            self.grid = grid.from_image(self.image)
+        else:
+            (width, height) = self.image.size
+            (codels, self.remapped) = quantize.image_to_indices(self.image,self.unknown_colors,self.tolerance,self.alpha)
+            self.grid = grid.CodelGrid(width,height,codels)
+            if self.debug.level:
+                self.debug.event(tracing.REMAPPED,0,self.remapped)
         
-    def find_color_blocks(self):
-        """Uses the connected component algorithm to build the program color blocks."""
-        next_label = 0
-        #Pass 1
-        for y in xrange(self.height):
-            for x in xrange(self.width):
-                pixel = self.pixels[x][y]
-                if not self.is_background(pixel.color):
-                    neighbours = self.neighbours(pixel)
-                    
-                    if neighbours == []:
-                        pixel.parent = self.pixels[x][y]
-                        pixel.set_label = next_label
-                        next_label = next_label + 1
-                    else:
-                        for n in neighbours:
-                            unionfind.union(n,pixel)
+    def scale_grid(self):
+        """Scales the loaded grid down to one cell per codel, guessing the
+        codel size first if it wasn't set."""
+        if self.codel_size == None:
+            self.codel_size = grid.detect_codel_size(self.grid)
+        self.grid = grid.downsample(self.grid,self.codel_size)
         
-        #Pass 2
-        for y in xrange(self.height):
-            for x in xrange(self.width):
-                pixel = self.pixels[x][y]
-                if not self.is_background(pixel.color):
-                    root = unionfind.find(pixel)
-                    pixel.set_size = root.set_size
-                    pixel.set_label = root.set_label
-                    #Build color block object
-                    if not self.color_blocks.has_key(pixel.set_label):
-                        self.color_blocks[pixel.set_label] = ColorBlock(pixel.set_size)
-                    self.color_blocks[pixel.set_label].update_boundaries(pixel)
+    def find_color_blocks(self,color_blocks=None):
+        """Labels the runs of color in each row to build the program color
+        blocks, unless the blocks of an already labeled grid are given or
+        the program is in the cache."""
+        cached = None
+        if color_blocks == None and not self.lazy and self.cache_dir != None:
+            cached = cache.load(self.cache_dir,self.grid)
+        if color_blocks != None:
+            self.color_blocks = color_blocks
+        elif cached != None:
+            self.color_blocks, self.table = cached
+        elif self.lazy:
+            self.lazy_blocks = lazy.LazyBlocks(self.grid)
+            self.color_blocks = self.lazy_blocks.color_blocks
+        elif self.jobs > 1:
+            self.color_blocks = tiles.label_blocks(self.grid,self.jobs)
+        else:
+            self.color_blocks = grid.label_blocks(self.grid)
+        if color_blocks == None and cached == None and not self.lazy and self.cache_dir != None\
+            and not self.uses_table():
+            #Otherwise the blocks are saved once, along with the table
+            cache.save(self.cache_dir,self.grid,self.color_blocks)
     
         #Debug
-        for i,color_block in self.color_blocks.items():
-            bounds = color_block.boundary_pixels
-            self.debug.writeln("Color Block %s: Size=%s, \n\tmaxRL=(%s,%s), maxRR=(%s,%s), \n\tmaxDL=(%s,%s), maxDR=(%s,%s), \n\tmaxLL=(%s,%s), maxLR=(%s,%s), \n\tmaxUL=(%s,%s), maxUR=(%s,%s)" \
-                % (i, color_block.size, 
-                   bounds[0][0].x,bounds[0][0].y, bounds[0][1].x, bounds[0][1].y,
-                   bounds[1][0].x,bounds[1][0].y, bounds[1][1].x, bounds[1][1].y,
-                   bounds[2][0].x,bounds[2][0].y, bounds[2][1].x, bounds[2][1].y,
-                   bounds[3][0].x,bounds[3][0].y, bounds[3][1].x, bounds[3][1].y))
+        if self.debug.level:
+            for i,color_block in self.color_blocks.items():
+                self.debug.event(tracing.COLOR_BLOCK,0,i,color_block.size)
+                for dp,(left,right) in enumerate(color_block.boundary_pixels):
+                    self.debug.event(tracing.BOUNDARY,0,dp,left[0],left[1],dp,right[0],right[1])
                     
-    def is_background(self,color):
-        """Tells us if the given color is black or white."""
-        if  colors.is_white(color) or colors.is_black(color):
-            return True
-        else:
-            return False
-        
-    def neighbours(self,pixel):
-        """Finds the neighbours of the given pixel with the same label."""
-        neighbours = []
-        index = 0;
-        x = pixel.x
-        y = pixel.y
-            
-        if y !=0 and self.pixels[x][y-1].color == pixel.color:
-            #Add above pixel
-            index = index + 1
-            neighbours.append(self.pixels[x][y-1])
+    def transition_table(self):
+        """Gets the TransitionTable of the program, compiling it and saving it
+        in the cache the first time."""
+        if self.table == None:
+            self.table = transitions.TransitionTable(self.grid,self.color_blocks)
+            if self.cache_dir != None and self.lazy_blocks == None:
+                cache.save(self.cache_dir,self.grid,self.color_blocks,self.table)
+        return self.table
+
+    def uses_table(self):
+        """Tells us whether the program is run by an engine that compiles a
+        TransitionTable."""
+        return self.engine != "step" and self.debug.level < tracing.STEP
+
+    def color_at(self,x,y):
+        """Gets the palette index of the codel at the given x and y."""
+        return self.grid.codels[y*self.width+x]
         
-        if x != 0 and self.pixels[x-1][y].color == pixel.color:
-            #Add left pixel
-            neighbours.append(self.pixels[x-1][y])
-            index = index + 1
-            
-        return neighbours      
-    
     def start_execution(self):
-        """Starts the execution of the program."""
-        if self.max_steps == -1:
-            while not self.finished:
-                self.do_next_step()
-        else:
-            for i in xrange(self.max_steps):
-                self.do_next_step()
-                if self.finished:
-                    return
-            self.debug.writeln("---EXECUTION FINISHED (Max Steps Reached)---")
+        """Starts the execution of the program. Its output is flushed when it
+        stops, however it stops."""
+        try:
+            if self.uses_table():
+                runner = engines[self.engine](self)
+                runner.run()
+                self.stats = runner.stats()
+            elif self.max_steps == -1:
+                while not self.finished:
+                    self.do_next_step()
+            else:
+                for i in xrange(self.max_steps):
+                    self.do_next_step()
+                    if self.finished:
+                        break
+                else:
+                    if self.debug.level:
+                        self.debug.event(tracing.MAX_STEPS,self.current_step)
+        finally:
+            self.output.flush()
+        if self.lazy_blocks != None:
+            self.stats = self.stats + self.lazy_blocks.stats()
+        if not quantize.is_default(self.unknown_colors,self.tolerance,self.alpha):
+            self.stats = self.stats + [("Pixels remapped", self.remapped)]
             
     def do_next_debug_step(self):
         if self.max_steps == -1:
             self.do_next_step()
+            self.output.flush()
         else:
             if self.current_step < self.max_steps:
                 self.do_next_step()
+                self.output.flush()
             else:
+                if self.debug.level:
+                    self.debug.event(tracing.MAX_STEPS,self.current_step)
                 return False
-                self.debug.writeln("---EXECUTION FINISHED (Max Steps Reached)---")
         if self.finished:
             return False
         else:
@@ -203,30 +331,34 @@ class Interpreter(object):
         """Executes a step in the program."""
         if self.thread != None:
             if self.thread.should_stop:
-                self.debug.writeln()
-                self.debug.writeln("---EXECUTION FINISHED (Thread was stopped)---")
+                if self.debug.level:
+                    self.debug.event(tracing.STOPPED,self.current_step)
                 self.finished = True
                 return
         self.current_step = self.current_step + 1
         if self.step == 0:
-            self.debug.writeln("  -> Moving within color block...")
+            if self.debug.level:
+                self.debug.event(tracing.MOVE_WITHIN,self.current_step)
             self.step = 1
             self.move_within_block()         
         elif self.step == 1:
-            self.debug.writeln("  -> Moving out of color block...")
+            if self.debug.level:
+                self.debug.event(tracing.MOVE_OUT,self.current_step)
             self.step = 0           
             self.move_out_of_block()               
         else:
             error_handler.handle_error("The step wasn't 0 or 1. That should never happen. This must be a bug in my code. Sorry")
-        if not self.finished:
-            self.debug.writeln()
-            self.debug.writeln("AT (%s,%s), COLOR=%s, DP=%d, CC=%s"\
-                % (self.current_pixel.x,self.current_pixel.y,self.current_pixel.color,\
-                self.dp, self.cc))
+        if not self.finished and self.debug.level:
+            self.trace_position()
+
+    def trace_position(self):
+        """Traces where execution is and the DP and CC."""
+        x,y = self.current_pixel_coords
+        self.debug.event(tracing.AT,self.current_step,x,y,self.color_at(x,y),self.dp,self.cc)
             
     def move_within_block(self):
         """Moves to the border pixel within the current color block."""
-        if colors.is_white(self.current_pixel.color):
+        if colors.is_white(self.color_at(*self.current_pixel_coords)):
             self.move_within_white()
         else:
             self.move_within_color()
@@ -237,14 +369,12 @@ class Interpreter(object):
         x,y = self.next_pixel_coords()
         if not self.is_pixel_obstruction(x,y):
             return
-        next_pixel = self.pixels[x][y]
         
-        while colors.is_white(next_pixel.color):
-            self.current_pixel = next_pixel
+        while colors.is_white(self.color_at(x,y)):
+            self.current_pixel_coords = (x,y)
             x,y = self.next_pixel_coords()
             if not self.is_pixel_obstruction(x,y):
                 return
-            next_pixel = self.pixels[x][y]
             
     def is_pixel_obstruction(self,x,y):
         """Tells us whether the pixel at the given x and y is an obstruction."""
@@ -256,18 +386,22 @@ class Interpreter(object):
     def move_within_color(self):
         """Moves within a color block to the required pixel
         at the max dp/cc direction."""
-        self.current_pixel = self.color_blocks\
-            [self.current_pixel.set_label].boundary_pixels\
+        x,y = self.current_pixel_coords
+        label = self.grid.labels[y*self.width+x]
+        if label == -1 and self.lazy_blocks != None:
+            #The block may not have been labeled yet
+            label = self.lazy_blocks.label_at(y*self.width+x)
+        self.current_pixel_coords = self.color_blocks[label].boundary_pixels\
             [self.dp][self.cc]
             
     def move_out_of_block(self):
         """Moves out of a color block and into the next color block, performing
         the operation if necessary."""
-        x,y = self.current_pixel.x, self.current_pixel.y
+        x,y = self.current_pixel_coords
         n_x,n_y = self.next_pixel_coords()
         
-        self.debug.writeln("  -> Trying to cross from (%s,%s) to (%s,%s)"\
-            %(x,y,n_x,n_y))
+        if self.debug.level:
+            self.debug.event(tracing.TRY_CROSS,self.current_step,x,y,n_x,n_y)
         
         #If we're at a wall
         if (self.dp == 0 and x >= self.width-1)\
@@ -277,34 +411,34 @@ class Interpreter(object):
                 self.hit_obstruction()
                 return
         
-        current_pixel = self.current_pixel
-        next_pixel = self.pixels[n_x][n_y]
+        current_color = self.color_at(x,y)
+        next_color = self.color_at(n_x,n_y)
         #If we're at a black pixel
-        if colors.is_black(next_pixel.color):
+        if colors.is_black(next_color):
             self.hit_obstruction()
             return
             
-        if colors.is_white(current_pixel.color)\
-            or colors.is_white(next_pixel.color):
-                pass
+        op_code = colors.transitions[current_color][next_color]
+        if op_code == None:
+            pass
         else:
             #Get the operation to do
-            hue_light_diff = colors.hue_light_diff(current_pixel.color,next_pixel.color)
-            op_name, op = self.operations[hue_light_diff]
-            self.debug.writeln("  -> Crossing from (%s,%s), color=%s to (%s,%s), color=%s"\
-                % (current_pixel.x, current_pixel.y, current_pixel.color,\
-                next_pixel.x, next_pixel.y, next_pixel.color))
-            self.debug.writeln("  -> Stack before %s = %s" % (op_name.upper(),self.stack))
-            self.debug.writeln("  -> Performing %s" % (op_name.upper()))
+            op_name, op = self.operations[op_code]
+            if self.debug.level:
+                self.debug.event(tracing.CROSS,self.current_step,x,y,current_color,n_x,n_y,next_color)
+                if self.debug.level >= tracing.STACK:
+                    self.debug.event(tracing.STACK_BEFORE,self.current_step,op_code,*tracing.stack_args(self.stack))
+                self.debug.event(tracing.PERFORM,self.current_step,op_code)
             op()
-            self.debug.writeln("  -> Stack after %s = %s" % (op_name.upper(),self.stack))
-        self.current_pixel = next_pixel
+            if self.debug.level >= tracing.STACK:
+                self.debug.event(tracing.STACK_AFTER,self.current_step,op_code,*tracing.stack_args(self.stack))
+        self.current_pixel_coords = (n_x,n_y)
         self.times_stopped = 0
         self.switch_cc = True
     
     def next_pixel_coords(self):
         """Returns the coordinates of the next pixel in the direction of the dp."""
-        x,y = self.current_pixel.x, self.current_pixel.y
+        x,y = self.current_pixel_coords
         if self.dp == 0:
             return (x+1,y)
         elif self.dp == 1:
@@ -318,9 +452,9 @@ class Interpreter(object):
     
     def hit_obstruction(self):
         """Handles the case when an obstruction is the next pixel."""
-        self.debug.writeln("  -> Hit an obstruction")
         self.times_stopped = self.times_stopped + 1
-        self.debug.writeln("  -> Obstructions Hit = %i" % (self.times_stopped))
+        if self.debug.level:
+            self.debug.event(tracing.HIT,self.current_step,self.times_stopped)
         self.step = 0
         if (self.times_stopped >= 8):
             self.stop_execution()
@@ -334,18 +468,21 @@ class Interpreter(object):
     
     def stop_execution(self):
         """Cancels execution of the program."""
-        self.debug.writeln("---EXECUTION FINISHED---")
+        if self.debug.level:
+            self.debug.event(tracing.FINISHED,self.current_step)
         self.finished = True
         
     def toggle_cc(self):
         """Toggles the cc."""
-        self.debug.writeln("  -> Toggling CC")
+        if self.debug.level:
+            self.debug.event(tracing.TOGGLE_CC,self.current_step)
         div,mod = divmod(1-self.cc,1)
         self.cc = div
     
     def rotate_dp(self,times=1):
         """Rotates the dp by the given number of times."""
-        self.debug.writeln("  -> Rotating DP by %s" % times)
+        if self.debug.level:
+            self.debug.event(tracing.ROTATE_DP,self.current_step,tracing.fit(times))
         div,mod = divmod(self.dp+times,4)
         self.dp = mod
         
@@ -379,12 +516,16 @@ class Interpreter(object):
     
     def op_in_char(self):
         """Piet IN(CHAR) operation."""
-        chr = getchr.get_chr()
-        self.stack.append(ord(chr))
+        #Whoever is typing the input should see the output asking for it
+        self.output.flush()
+        char = self.input.read_char()
+        if char != None:
+            self.stack.append(ord(char))
     
     def op_push(self):
         """Piet Push operation."""
-        self.stack.append(self.current_pixel.set_size)
+        x,y = self.current_pixel_coords
+        self.stack.append(self.grid.sizes[self.grid.labels[y*self.width+x]])
     
     def op_subtract(self):
         """Piet Subtract operation."""
@@ -412,33 +553,26 @@ class Interpreter(object):
             num_rolls = self.stack.pop()
             depth = self.stack.pop()    
             if depth >0:
-                for i in xrange(abs(num_rolls)):
-                    self.roll(depth,num_rolls<0)    
+                self.roll(depth,num_rolls)
     
-    def roll(self,depth,reverse):
-        """Does a single roll."""
+    def roll(self,depth,num_rolls):
+        """Rolls the top depth items of the stack num_rolls times. A roll
+        buries the top item depth deep, and a negative roll brings the item
+        depth deep to the top. The rolls are taken modulo depth and done as
+        one rotation, so any number of them costs the same."""
         if depth > len(self.stack):
             depth = len(self.stack)
-
-        if reverse:
-            bottom_item = self.stack[0]
-            index = depth
-            for i in xrange(index):
-                self.stack[i] = self.stack[i+1]
-            self.stack[index] = bottom_item
-        else:
-            top_item = self.stack[-1]
-            index = len(self.stack)-depth
-            for i in xrange(len(self.stack)-1,index,-1):
-                self.stack[i] = self.stack[i-1]    
-            self.stack[index] = top_item
+        if depth == 0:
+            return
+        rolls = num_rolls % depth
+        if rolls:
+            self.stack[-depth:] = self.stack[-rolls:] + self.stack[-depth:-rolls]
     
     def op_out_number(self):
         """Piet OUT(NUM) operation."""
         if len(self.stack) >=1:
             item = self.stack.pop()
-            sys.stdout.write(str(item))
-            sys.stdout.flush()
+            self.output.write(str(item))
     
     def op_pop(self):
         """Piet Pop operation."""
@@ -462,82 +596,33 @@ class Interpreter(object):
         """Piet Switch operation."""
         if len(self.stack) >=1:
             item = self.stack.pop()
-            for i in xrange(item):
+            #Toggling an even number of times, either way, does nothing
+            if item%2 == 1:
                 self.toggle_cc()
     
     def op_in_number(self):
         """Piet IN(NUM) operation."""
-        char = getchr.get_chr()
-        try:
-            self.stack.append(int(char))
-        except ValueError:
-            pass      
+        self.output.flush()
+        number = self.input.read_number()
+        if number != None:
+            self.stack.append(number)
     
     def op_out_char(self):
         """Piet OUT(CHAR) operation."""
         if len(self.stack) >=1:
             item = self.stack.pop()
-            sys.stdout.write(chr(item))
-            sys.stdout.flush()
-    
-    
-class ColorBlock(object):
-    """Class that represents a color block in a Piet program."""
-    def __init__(self,size):
-        """Initializes new ColorBlock."""
-        self.size = size
-        #boundary_pixels = [[DPR_CCL,DPR_CCR],[DPD_CCL,DPD,CCR] ... etc.
-        self.boundary_pixels = [[None,None] for i in xrange(4)]
-        
-    def update_boundaries(self,pixel):
-        """Updates the boundary pixels of the current color block given a new pixel."""
-        #If a new maximum (right, left)
-        if self.boundary_pixels[0][0] == None or pixel.x > self.boundary_pixels[0][0].x:
-            self.boundary_pixels[0][0] = pixel
-            
-        #If a new maximum (right, right)
-        if self.boundary_pixels[0][1] == None or pixel.x >= self.boundary_pixels[0][1].x:
-            self.boundary_pixels[0][1] = pixel
-            
-        #If a new maximum (down, right)
-        if self.boundary_pixels[1][1] == None or pixel.y > self.boundary_pixels[1][1].y:
-            self.boundary_pixels[1][1]= pixel
-        
-        #If a new maximum (down, left)
-        if self.boundary_pixels[1][0] == None or pixel.y >= self.boundary_pixels[1][0].y:
-            self.boundary_pixels[1][0] = pixel
-            
-        #If a new maximum (left, right)
-        if self.boundary_pixels[2][1] == None or pixel.x < self.boundary_pixels[2][1].x:
-            self.boundary_pixels[2][1] = pixel
-        
-        #If a new maximum (left, left)
-        if self.boundary_pixels[2][0] == None or pixel.x <= self.boundary_pixels[2][0].x:
-            self.boundary_pixels[2][0] = pixel
-            
-        #If a new maximum (up,left)
-        if self.boundary_pixels[3][0] == None:
-            self.boundary_pixels[3][0] = pixel
-            
-        #If a new maximum (up,right)
-        if self.boundary_pixels[3][1] == None or pixel.y == self.boundary_pixels[3][1].y:
-            self.boundary_pixels[3][1] = pixel
-                
-             
-class Pixel(object):
-    """Class that represents a pixel in a Piet program (stricly a codel, but 
-    the convention is 1 pixel per codel."""
+            self.output.write(chr(item))
     
-    def __init__(self,x,y,color):
-        """Initializes new Pixel."""
-        self.x = x
-        self.y = y
-        self.color = color
-        self.parent = self   
-        self.set_size = 1
-        self.set_label = -1
-        
     
+#Engines that can be chosen instead of running one step at a time
+engines = {
+    "table": engine.TableEngine,
+    "fused": fusion.FusedEngine,
+    "jit": jit.JitEngine,
+    "memo": memo.MemoEngine,
+}
+
+
 class ErrorHandler(object):
     """Class that handles errors for the interpreter. Does it differently
     for UI and command line modes."""
@@ -561,12 +646,33 @@ def print_usage():
     print "options:"
     print "\t-h (--help)\t- Prints this help"
     print "\t-d (--debug)\t- Prints debug information"
+    print "\t--trace <file>\t- Records the events of the program in a ring buffer, which is saved to the file when it ends. tracing.py prints them."
+    print "\t--trace-level <level>\t- Sets which events are recorded: 1 for loading and finishing, 2 for each step, 3 for the stack too (by default)."
     print "\t-m (--maxsteps)\t- Sets maximum steps to execute. This is 10^6 by default. Set to -1 for infinite."
+    print "\t-c (--codel-size)\t- Sets the size of a codel in pixels. This is guessed from the image by default."
+    print "\t-j (--jobs)\t- Sets the number of processes used to scan color blocks. This is 1 by default."
+    print "\t-e (--engine)\t- Sets how the program is run: step (by default), table, which compiles a table of transitions between color blocks first, fused, which also compiles straight paths into Python functions, memo, which also remembers the results of the paths for the stack items they read, or jit, which compiles the loops the program spends its time in."
+    print "\t-s (--stats)\t- Prints statistics of the engine when the program ends."
+    print "\t-l (--lazy)\t- Labels color blocks as the program reaches them, instead of labeling the whole image first."
+    print "\t--unknown <policy>\t- Sets what pixels that aren't within the tolerance of a Piet color become: white (by default), black, nearest, the nearest Piet color however far it is, or error, which stops with an error."
+    print "\t--tolerance <distance>\t- Maps pixels within this distance in RGB of a Piet color to the nearest one. This is 0 by default."
+    print "\t--alpha <policy>\t- Sets what transparent pixels become: ignore, which uses their color (by default), white or black."
+    print "\t-i (--input) <file>\t- Reads the input of the program from a file instead of stdin. Input from a terminal is read a key at a time, and otherwise a buffer at a time. IN(Number) reads a number with an optional sign, skipping whitespace before it, and reads nothing more if there is no number. At the end of the input, or Ctrl-D at a terminal, IN(Char) and IN(Number) push nothing."
+    print "\t-o (--output) <file>\t- Writes the output of the program to a file instead of stdout."
+    print "\t-b (--buffering) <mode>\t- Sets how output is buffered: block, line or none. Output is line buffered when it goes to a terminal and block buffered otherwise by default. It is always flushed before input is read."
+    print "\t--cache-dir <dir>\t- Caches compiled programs in the directory, so a program run again isn't labeled and compiled from scratch. Nothing is cached by default. The entries are unpickled, so only give a directory no one else can write to."
+    print "\t--clear-cache\t- Removes every program from the cache given by --cache-dir. No image needs to be given."
+
+def print_stats(stats):
+    """Prints statistics to stderr, so they aren't mixed with the output."""
+    sys.stderr.write("\n")
+    for name,value in stats:
+        sys.stderr.write("%s: %s\n" % (name,value))
 
 def getopts():
     """Parses the command line options."""
     try:
-       return getopt.getopt(sys.argv[1:], "hdm:", ["help","debug","maxsteps="])
+       return getopt.getopt(sys.argv[1:], "hdm:c:j:e:sli:o:b:", ["help","debug","maxsteps=","codel-size=","jobs=","engine=","stats","lazy","unknown=","tolerance=","alpha=","input=","output=","buffering=","trace=","trace-level=","cache-dir=","clear-cache"])
     except getopt.GetoptError, err:
         print str(err)
         print_usage()
@@ -586,10 +692,25 @@ if __name__ == "__main__":
                     sys.exit(1)
                 else:
                     interpreter.set_opt(o,a)
+            if interpreter.clear_cache and interpreter.cache_dir != None:
+                cache.clear(interpreter.cache_dir)
+                if len(args) == 0:
+                    sys.exit(0)
             if len(args) != 1:
                 print_usage()
                 sys.exit(2)
-            interpreter.run_program(args[0])
+            try:
+                try:
+                    interpreter.run_program(args[0])
+                except IOError, err:
+                    error_handler.handle_error(str(err))
+            finally:
+                interpreter.output.close()
+                interpreter.input.close()
+                if interpreter.trace_path != None:
+                    interpreter.debug.save(interpreter.trace_path)
+            if interpreter.show_stats:
+                print_stats(interpreter.stats)
         else:
             print_usage()
     except KeyboardInterrupt:
@@ -19,6 +19,9 @@ __maintainer__ = "Steven Anderson"
 __email__ = "steven.james.anderson@googlemail.com"
 __status__ = "Production"
 
+#Marks pixels while a color block is being flood filled
+FILLED = -1
+
 def print_usage():
     """Prints usage string for command line"""
     print "Usage: interpreter.py image"
@@ -38,26 +41,27 @@ class Interpreter(object):
         self.stack = []
         self.block_size = 0
         self.boundary_pixel_coords = None
-        #Indexed by hue and light change
-        self.operations = {
-            (1,0):("Add",self.op_add),
-            (2,0):("Divide",self.op_divide),
-            (3,0):("Greater",self.op_greater),
-            (4,0):("Duplicate",self.op_duplicate),
-            (5,0):("IN(char)",self.op_in_char),
-            (0,1):("Push",self.op_push),
-            (1,1):("Subtract",self.op_subtract),
-            (2,1):("Mod",self.op_mod),
-            (3,1):("Pointer",self.op_pointer),
-            (4,1):("Roll",self.op_roll),
-            (5,1):("OUT(Number)",self.op_out_number),
-            (0,2):("Pop",self.op_pop),
-            (1,2):("Multiply",self.op_multiply),
-            (2,2):("Not",self.op_not),
-            (3,2):("Switch",self.op_switch),
-            (4,2):("IN(Number)",self.op_in_number),
-            (5,2):("OUT(Char)",self.op_out_char),
-        }
+        #Indexed by operation code (hue change*3 + light change)
+        self.operations = [
+            None,
+            ("Push",self.op_push),
+            ("Pop",self.op_pop),
+            ("Add",self.op_add),
+            ("Subtract",self.op_subtract),
+            ("Multiply",self.op_multiply),
+            ("Divide",self.op_divide),
+            ("Mod",self.op_mod),
+            ("Not",self.op_not),
+            ("Greater",self.op_greater),
+            ("Pointer",self.op_pointer),
+            ("Switch",self.op_switch),
+            ("Duplicate",self.op_duplicate),
+            ("Roll",self.op_roll),
+            ("IN(Number)",self.op_in_number),
+            ("IN(char)",self.op_in_char),
+            ("OUT(Number)",self.op_out_number),
+            ("OUT(Char)",self.op_out_char),
+        ]
     
     def run_program(self,path):
         """Runs a program at the given path"""
@@ -76,8 +80,8 @@ class Interpreter(object):
             raise IOError, "IMAGE_NOT_LOADED"
         
         (self.width, self.height) = self.image.size
-        rawpixels = self.image.getdata()
-        self.pixels = dict([((x,y),colors.rgb_to_hex(rawpixels[y*(self.width)+x])) for x in range(self.width) for y in range(self.height)])
+        rawpixels = colors.image_to_indices(self.image)
+        self.pixels = dict([((x,y),rawpixels[y*(self.width)+x]) for x in range(self.width) for y in range(self.height)])
         #for x in range(self.width):
         #    for y in range(self.height):
         #        print "Pixel: (%s,%s) - %s" % (x,y,self.pixels[(x,y)])
@@ -133,10 +137,10 @@ class Interpreter(object):
         #print "Start - looking for ",color
         self.block_size = 0
         self.boundary_pixel_coords = None
-        self.floodfill(coords,color,"WTF")
+        self.floodfill(coords,color,FILLED)
         self.block_size = 0
         self.boundary_pixel_coords = None
-        self.floodfill(coords,"WTF",color)
+        self.floodfill(coords,FILLED,color)
         self.current_pixel_coords = self.boundary_pixel_coords
         #print self.boundary_pixel_coords
         
@@ -224,13 +228,12 @@ class Interpreter(object):
             self.hit_obstruction()
             return
             
-        if colors.is_white(current_pixel)\
-            or colors.is_white(next_pixel):
-                pass
+        op_code = colors.transitions[current_pixel][next_pixel]
+        if op_code == None:
+            pass
         else:
             #Get the operation to do
-            hue_light_diff = colors.hue_light_diff(current_pixel,next_pixel)
-            op_name, op = self.operations[hue_light_diff]
+            op_name, op = self.operations[op_code]
             #print op_name
             op()
         self.current_pixel_coords = next_pixel_coords
@@ -0,0 +1,136 @@
+"""Tracing compiler for the loops a Piet program spends its time in"""
+
+import sys
+from array import array
+import engine
+import transitions
+import codegen
+import fusion
+import loops
+
+__author__ = "Steven Anderson"
+__copyright__ = "Steven Anderson 2008"
+__credits__ = ["Steven Anderson"]
+__license__ = "GPL"
+__version__ = "0.0.1"
+__maintainer__ = "Steven Anderson"
+__email__ = "steven.james.anderson@googlemail.com"
+__status__ = "Production"
+
+#Times a state is entered before a trace is recorded from it
+HOT_THRESHOLD = 50
+#Most transitions put in one trace
+MAX_TRACE_LENGTH = 200
+
+
+class JitEngine(engine.TableEngine):
+    """Class that runs a program like the TableEngine, counting the times
+    each state is entered. Once a state is hot, the transitions taken from it
+    are recorded until the program comes back to it, along with which way
+    each Pointer and Switch went. The trace is compiled into a function that
+    goes round the loop with a guard on each branch. When a guard fails, the
+    function stops and the table carries on from there. A trace that can't
+    be recorded up to the start again, because of a Roll or input on the
+    way, is compiled without the loop. A loop that only counts is skipped
+    to the time round its guard fails."""
+
+    def __init__(self,interpreter):
+        """Initializes new JitEngine."""
+        engine.TableEngine.__init__(self,interpreter)
+        self.counts = array('i',[0])*len(self.table.next_states)
+        #Compiled traces by start state, None where no trace could be made
+        self.traces = {}
+        #Loops compiled that only count
+        self.counting_loops = []
+        #States and transitions of the trace being recorded
+        self.trace_states = None
+        self.trace_transitions = None
+
+    def run_table(self):
+        """Runs transitions from the table, stopping any trace being recorded,
+        as the interpreter may have taken steps since."""
+        self.trace_states = None
+        engine.TableEngine.run_table(self)
+
+    def find_path(self,state):
+        """Called each time a state is entered. Gets the compiled trace
+        starting from the state, counting the state or recording it if there
+        isn't one."""
+        if self.trace_states != None:
+            self.record(state)
+            return None
+        if self.traces.has_key(state):
+            return self.traces[state]
+        self.counts[state] = self.counts[state]+1
+        if self.counts[state] >= HOT_THRESHOLD:
+            self.trace_states = [state]
+            self.trace_transitions = []
+        return None
+
+    def record(self,state):
+        """Records the transition into a state in the trace."""
+        transition = self.trace_transition(self.trace_states[-1],state)
+        if transition == None:
+            self.compile_trace(False)
+            return
+        self.trace_states.append(state)
+        self.trace_transitions.append(transition)
+        if state == self.trace_states[0]:
+            self.compile_trace(True)
+        elif len(self.trace_transitions) >= MAX_TRACE_LENGTH:
+            self.compile_trace(False)
+
+    def trace_transition(self,previous,state):
+        """Gets the (operation, value, steps, codel entered) of the transition
+        from one state to the next, where the value is the Push value or
+        the outcome of a Pointer or Switch. Returns None if the transition
+        can't be put in a trace."""
+        transition = self.table.resolve(previous)
+        if transition == None:
+            return None
+        op, steps, next_state, position = transition
+        label, dp, cc = transitions.split_state(next_state)
+        new_label, new_dp, new_cc = transitions.split_state(state)
+        if op == codegen.POINTER and new_label == label and new_cc == cc:
+            return (op, (new_dp-dp)%4, steps, position)
+        if op == codegen.SWITCH and new_label == label and new_dp == dp:
+            return (op, new_cc != cc, steps, position)
+        if op in codegen.STRAIGHT_OPS and next_state == state:
+            return (op, self.interpreter.grid.sizes[previous>>3], steps, position)
+        return None
+
+    def compile_trace(self,loop):
+        """Compiles the trace recorded so far and stops recording."""
+        start = self.trace_states[0]
+        if len(self.trace_transitions) < 2:
+            self.traces[start] = None
+        else:
+            code = codegen.StraightLine("trace_%d" % (start),loop)
+            steps = [0]
+            positions = [None]
+            for op, value, transition_steps, position in self.trace_transitions:
+                code.add_op(op,value)
+                steps.append(steps[-1]+transition_steps)
+                positions.append(position)
+            path = fusion.Path(code.compile(),self.trace_states,steps,positions,loop,code.taken)
+            if loop:
+                counting_loop = loops.find_counting_loop([transition[:2] for transition in self.trace_transitions])
+                if counting_loop != None:
+                    #Going round takes no time however many times it is
+                    path.function = counting_loop.accelerate(path.function,len(self.trace_transitions))
+                    path.max_iterations = sys.maxint
+                    self.counting_loops.append(counting_loop)
+            self.traces[start] = path
+        self.trace_states = None
+        self.trace_transitions = None
+
+    def stats(self):
+        """Gets the statistics of the engine as a list of (name, value) pairs."""
+        traces = [trace for trace in self.traces.values() if trace != None]
+        return engine.TableEngine.stats(self) + [
+            ("Traces compiled", len(traces)),
+            ("Traces that loop", len([trace for trace in traces if trace.loop])),
+            ("Traces entered", sum(trace.entered for trace in traces)),
+            ("Traces exited by a guard", sum(trace.exited for trace in traces)),
+            ("Counting loops", len(self.counting_loops)),
+            ("Times round counting loops skipped", sum(counting_loop.skipped for counting_loop in self.counting_loops))]
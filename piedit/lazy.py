@@ -0,0 +1,121 @@
+"""Labels the color blocks of a program as execution reaches them"""
+
+import colors
+import grid
+
+__author__ = "Steven Anderson"
+__copyright__ = "Steven Anderson 2008"
+__credits__ = ["Steven Anderson"]
+__license__ = "GPL"
+__version__ = "0.0.1"
+__maintainer__ = "Steven Anderson"
+__email__ = "steven.james.anderson@googlemail.com"
+__status__ = "Production"
+
+
+class LazyBlocks(object):
+    """Class that labels the color blocks of a grid one at a time, the first
+    time execution enters each one, instead of labeling the whole program
+    before it starts. Labels are given in the order the blocks are reached,
+    and codels of blocks not reached yet are left at -1 like white and
+    black."""
+
+    def __init__(self,codel_grid):
+        """Initializes new LazyBlocks for an unlabeled grid."""
+        self.grid = codel_grid
+        #ColorBlock objects of the blocks labeled so far, indexed by label
+        self.color_blocks = {}
+        self.labeled = 0
+        #Labels of blocks whose exits have been followed by label_reachable
+        self.followed = set()
+
+    def label_at(self,index):
+        """Gets the label of the block holding the codel at the given flat
+        index, labeling the block first if it hasn't been. Returns -1 for
+        white and black codels."""
+        label = self.grid.labels[index]
+        color = self.grid.codels[index]
+        if label == -1 and not (colors.is_white(color) or colors.is_black(color)):
+            label = self.fill_block(index)
+        return label
+
+    def fill_block(self,start):
+        """Flood fills the block holding the codel at start with a new label
+        and builds its ColorBlock. Returns the label."""
+        codel_grid = self.grid
+        codels = codel_grid.codels
+        labels = codel_grid.labels
+        width = codel_grid.width
+        color = codels[start]
+        label = len(codel_grid.sizes)
+        labels[start] = label
+        pixels = [start]
+        stack = [start]
+        while stack:
+            for neighbor in self.neighbors(stack.pop()):
+                if codels[neighbor] == color and labels[neighbor] != label:
+                    labels[neighbor] = label
+                    pixels.append(neighbor)
+                    stack.append(neighbor)
+
+        color_block = grid.ColorBlock(len(pixels))
+        for index in sorted(pixels):
+            y, x = divmod(index,width)
+            color_block.update_boundaries(x,y)
+        codel_grid.sizes.append(len(pixels))
+        self.color_blocks[label] = color_block
+        self.labeled = self.labeled + len(pixels)
+        return label
+
+    def neighbors(self,index):
+        """Gets the indices of the codels above, below, left and right of a codel."""
+        width = self.grid.width
+        x = index%width
+        neighbors = []
+        if x > 0:
+            neighbors.append(index-1)
+        if x < width-1:
+            neighbors.append(index+1)
+        if index >= width:
+            neighbors.append(index-width)
+        if index+width < len(self.grid.codels):
+            neighbors.append(index+width)
+        return neighbors
+
+    def label_reachable(self,start):
+        """Labels every block execution can reach from the codel at start, as
+        the engines need the whole graph of blocks before they run. Every
+        exit of each block is followed, as a Pointer or Switch may take
+        execution out of any of them. Execution going into white may come
+        out into any block touching the white."""
+        codel_grid = self.grid
+        codels = codel_grid.codels
+        width, height = codel_grid.width, codel_grid.height
+        seen_white = bytearray(len(codels))
+        pending = [start]
+        while pending:
+            index = pending.pop()
+            color = codels[index]
+            if colors.is_black(color):
+                continue
+            if colors.is_white(color):
+                if seen_white[index]:
+                    continue
+                seen_white[index] = 1
+                pending.extend(self.neighbors(index))
+                continue
+            label = self.label_at(index)
+            if label in self.followed:
+                continue
+            self.followed.add(label)
+            for dp in xrange(4):
+                for x,y in self.color_blocks[label].boundary_pixels[dp]:
+                    x,y = ((x+1,y),(x,y+1),(x-1,y),(x,y-1))[dp]
+                    if x >= 0 and y >= 0 and x < width and y < height:
+                        pending.append(y*width+x)
+
+    def stats(self):
+        """Gets the statistics of the labeling as a list of (name, value) pairs."""
+        total = len(self.grid.codels)
+        return [("Color blocks labeled", len(self.color_blocks)),
+            ("Codels labeled", "%d of %d (%.1f%%)" % (self.labeled,total,100.0*self.labeled/max(total,1)))]
@@ -0,0 +1,273 @@
+"""Finds loops that only count, so they can be skipped to the last time round"""
+
+import codegen
+
+__author__ = "Steven Anderson"
+__copyright__ = "Steven Anderson 2008"
+__credits__ = ["Steven Anderson"]
+__license__ = "GPL"
+__version__ = "0.0.1"
+__maintainer__ = "Steven Anderson"
+__email__ = "steven.james.anderson@googlemail.com"
+__status__ = "Production"
+
+#Items on the symbolic stack are tuples of a kind, coefficients and a
+#constant. Coefficients are a dict from the depth an item was read from at
+#the start of the loop, 1 for the top, to what it is multiplied by.
+#A linear item, sum of coefficient*item + constant
+LINEAR = "linear"
+#1 if the linear sum is zero, else 0, as left by Not
+ZERO = "zero"
+#1 if the linear sum is above zero, else 0, as left by Greater
+POSITIVE = "positive"
+
+
+class NotCounting(Exception):
+    """Raised when a loop does something other than counting."""
+    pass
+
+
+def find_counting_loop(ops):
+    """Works out what a loop of (operation, value) pairs, as given to
+    codegen.StraightLine, does to the stack. Returns a CountingLoop if all it
+    does is add the same amount to one item each time round, with Pointer and
+    Switch guards that only depend on that item and items it doesn't change.
+    Returns None otherwise, such as when it writes output."""
+    stack = []
+    #Items read from the stack so far
+    reads = [0]
+    guards = []
+    def pop():
+        if stack:
+            return stack.pop()
+        reads[0] = reads[0] + 1
+        return (LINEAR, {reads[0]: 1}, 0)
+    try:
+        for op, value in ops:
+            if op == 0:
+                pass
+            elif op == codegen.PUSH:
+                stack.append((LINEAR, {}, value))
+            elif op == codegen.POP:
+                pop()
+            elif op == codegen.ADD:
+                top, second = linear(pop()), linear(pop())
+                stack.append(add(second,top,1))
+            elif op == codegen.SUBTRACT:
+                top, second = linear(pop()), linear(pop())
+                stack.append(add(second,top,-1))
+            elif op == codegen.MULTIPLY:
+                top, second = linear(pop()), linear(pop())
+                if not top[1]:
+                    stack.append(scale(second,top[2]))
+                elif not second[1]:
+                    stack.append(scale(top,second[2]))
+                else:
+                    raise NotCounting
+            elif op == codegen.DIVIDE or op == codegen.MOD:
+                top, second = constant(pop()), constant(pop())
+                if top == 0:
+                    raise NotCounting
+                if op == codegen.DIVIDE:
+                    stack.append((LINEAR, {}, second/top))
+                else:
+                    stack.append((LINEAR, {}, second % top))
+            elif op == codegen.NOT:
+                item = linear(pop())
+                stack.append(fold((ZERO, item[1], item[2])))
+            elif op == codegen.GREATER:
+                top, second = linear(pop()), linear(pop())
+                difference = add(second,top,-1)
+                stack.append(fold((POSITIVE, difference[1], difference[2])))
+            elif op == codegen.DUPLICATE:
+                item = pop()
+                stack.append(item)
+                stack.append(item)
+            elif op == codegen.POINTER:
+                guards.append(pointer_guard(pop(),value))
+            elif op == codegen.SWITCH:
+                guards.append(switch_guard(pop(),value))
+            else:
+                #Output, or an operation a trace doesn't hold
+                raise NotCounting
+        return CountingLoop(reads[0],stack,[guard for guard in guards if guard != None])
+    except NotCounting:
+        return None
+
+def linear(item):
+    """Checks that an item is linear."""
+    if item[0] != LINEAR:
+        raise NotCounting
+    return item
+
+def constant(item):
+    """Gets the value of an item that is the same every time round."""
+    if item[0] != LINEAR or item[1]:
+        raise NotCounting
+    return item[2]
+
+def add(item1,item2,sign):
+    """Adds, or takes away with a sign of -1, two linear items."""
+    coefficients = dict(item1[1])
+    for depth, coefficient in item2[1].items():
+        coefficients[depth] = coefficients.get(depth,0) + sign*coefficient
+        if coefficients[depth] == 0:
+            del coefficients[depth]
+    return (LINEAR, coefficients, item1[2]+sign*item2[2])
+
+def scale(item,factor):
+    """Multiplies a linear item by a constant."""
+    if factor == 0:
+        return (LINEAR, {}, 0)
+    return (LINEAR, dict((depth, coefficient*factor) for depth, coefficient in item[1].items()), item[2]*factor)
+
+def fold(item):
+    """Works out Not and Greater items of constants."""
+    if item[1]:
+        return item
+    if item[0] == ZERO:
+        return (LINEAR, {}, int(item[2] == 0))
+    return (LINEAR, {}, int(item[2] > 0))
+
+def pointer_guard(item,turns):
+    """Gets the guard for a Pointer that turns the DP the given times, as
+    (kind, coefficients, constant, value needed), or None if it always
+    passes."""
+    if item[0] == LINEAR:
+        if not item[1]:
+            if item[2]%4 != turns:
+                raise NotCounting
+            return None
+        return ("modulo", item[1], item[2], turns)
+    if turns > 1:
+        #The item is 0 or 1
+        raise NotCounting
+    return item + (turns,)
+
+def switch_guard(item,toggled):
+    """Gets the guard for a Switch that toggles the CC or not."""
+    toggled = int(bool(toggled))
+    if item[0] == LINEAR:
+        if not item[1]:
+            if item[2]%2 != toggled:
+                raise NotCounting
+            return None
+        return ("parity", item[1], item[2], toggled)
+    return item + (toggled,)
+
+
+class CountingLoop(object):
+    """Class that represents a loop that leaves the stack as it found it
+    apart from one item, the counter, which has the same amount added each
+    time round. The amount may depend on the other items read. Each guard
+    is (kind, coefficients, constant, value needed), and fails the first
+    time round that its item isn't the value needed."""
+
+    def __init__(self,reads,pushed,guards):
+        """Initializes new CountingLoop from the items a loop reads, the
+        symbolic items it leaves in their place and its guards. Raises
+        NotCounting if it isn't one."""
+        if len(pushed) != reads:
+            raise NotCounting
+        self.reads = reads
+        self.counter = None
+        self.delta = ({}, 0)
+        for index, item in enumerate(pushed):
+            depth = reads-index
+            linear(item)
+            if item[1] == {depth: 1} and item[2] == 0:
+                continue
+            if self.counter != None or item[1].get(depth) != 1:
+                raise NotCounting
+            self.counter = depth
+            delta = dict(item[1])
+            del delta[depth]
+            self.delta = (delta, item[2])
+        for kind, coefficients, offset, needed in guards:
+            #Only Not and Greater give a test the counter can be solved for
+            if kind != ZERO and kind != POSITIVE and coefficients.has_key(self.counter):
+                raise NotCounting
+        self.guards = guards
+
+    def value(self,stack,coefficients,offset):
+        """Works out a linear sum the first time round."""
+        length = len(stack)
+        return sum(coefficient*stack[length-depth] for depth, coefficient in coefficients.items()) + offset
+
+    def iterations(self,stack):
+        """Gets the number of times round the loop before a guard fails, or
+        None if none ever does."""
+        if self.counter == None:
+            step = 0
+        else:
+            step = self.value(stack,*self.delta)
+        first = None
+        for kind, coefficients, offset, needed in self.guards:
+            value = self.value(stack,coefficients,offset)
+            change = step*coefficients.get(self.counter,0)
+            fails = fails_at(kind,value,change,needed)
+            if fails != None and (first == None or fails < first):
+                first = fails
+        return first
+
+    def skip(self,stack,iterations):
+        """Goes round the loop the given number of times."""
+        if self.counter != None:
+            stack[len(stack)-self.counter] = stack[len(stack)-self.counter] + iterations*self.value(stack,*self.delta)
+
+    def accelerate(self,function,length):
+        """Gets a function that does the same as the compiled function of a
+        loop with the given number of transitions, but skips the times round
+        before a guard fails or the iterations run out."""
+        def accelerated(stack,iterations=1,write=codegen.write):
+            if len(stack) < self.reads:
+                return function(stack,iterations,write)
+            skipped = self.iterations(stack)
+            if skipped == None or skipped > iterations:
+                skipped = iterations
+            self.skip(stack,skipped)
+            self.skipped = self.skipped + skipped
+            if skipped == iterations:
+                return skipped*length
+            return skipped*length + function(stack,iterations-skipped,write)
+        return accelerated
+
+    #Times round skipped by accelerated functions
+    skipped = 0
+
+
+def fails_at(kind,value,change,needed):
+    """Gets the first time round, counting from 0, that a guard fails, where
+    its linear sum starts at the value and changes by the given amount each
+    time round. Returns None if it never fails."""
+    if kind == "modulo":
+        if value%4 != needed:
+            return 0
+    elif kind == "parity":
+        if value%2 != needed:
+            return 0
+    elif kind == ZERO:
+        if needed:
+            #Fails once the sum isn't zero
+            if value != 0:
+                return 0
+            if change != 0:
+                return 1
+        elif change == 0:
+            if value == 0:
+                return 0
+        elif -value % change == 0 and -value // change >= 0:
+            return -value // change
+    elif kind == POSITIVE:
+        if needed:
+            #Fails once the sum is zero or less
+            if value <= 0:
+                return 0
+            if change < 0:
+                return (value-change-1) // -change
+        else:
+            if value > 0:
+                return 0
+            if change > 0:
+                return -value // change + 1
+    return None
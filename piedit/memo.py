@@ -0,0 +1,103 @@
+"""Memoizes the straight paths through a Piet program on the stack they read"""
+
+from collections import OrderedDict
+import codegen
+import fusion
+
+__author__ = "Steven Anderson"
+__copyright__ = "Steven Anderson 2008"
+__credits__ = ["Steven Anderson"]
+__license__ = "GPL"
+__version__ = "0.0.1"
+__maintainer__ = "Steven Anderson"
+__email__ = "steven.james.anderson@googlemail.com"
+__status__ = "Production"
+
+#Most results kept in the cache
+CACHE_SIZE = 4096
+
+
+class RegionCache(object):
+    """Class that holds the results of running paths, keyed by the start
+    state and the items read from the top of the stack. A result is the
+    number of transitions done, the items left in their place and the output
+    written. The cache is least recently used first, and the oldest result
+    is thrown away when it is full."""
+
+    def __init__(self,size=CACHE_SIZE):
+        """Initializes new RegionCache."""
+        self.size = size
+        self.results = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def memoize(self,start,function,reads):
+        """Gets a function that does the same as the function of a path
+        starting from the given state, which reads the given number of items,
+        looking its results up in the cache."""
+        results = self.results
+        def memoized(stack,iterations=1,write=codegen.write):
+            if len(stack) < reads:
+                #The path stops before it does anything
+                return function(stack,iterations,write)
+            key = (start, tuple(stack[len(stack)-reads:]))
+            result = results.pop(key,None)
+            if result == None:
+                self.misses = self.misses + 1
+                #The path is run on a stack of just the items it reads
+                scratch = stack.__class__(key[1])
+                output = []
+                done = function(scratch,iterations,output.append)
+                result = (done, scratch[:], "".join(output))
+                if len(results) >= self.size:
+                    results.popitem(last=False)
+                    self.evictions = self.evictions + 1
+            else:
+                self.hits = self.hits + 1
+            results[key] = result
+            done, items, output = result
+            stack.replace_top(reads,items)
+            if output:
+                write(output)
+            return done
+        return memoized
+
+    def stats(self):
+        """Gets the statistics of the cache as a list of (name, value) pairs."""
+        lookups = self.hits + self.misses
+        if lookups:
+            hit_rate = "%.1f%%" % (100.0*self.hits/lookups)
+        else:
+            hit_rate = "-"
+        return [("Cache size", "%d of %d" % (len(self.results),self.size)),
+            ("Cache hits", self.hits),
+            ("Cache misses", self.misses),
+            ("Cache hit rate", hit_rate),
+            ("Cache evictions", self.evictions)]
+
+
+class MemoEngine(fusion.FusedEngine):
+    """Class that runs a program like the FusedEngine, but remembers what each
+    path did with the items it read from the stack. When a path is entered
+    again with the same items on top of the stack, the items it left, the
+    output it wrote and the steps it took are put in place without running
+    it. The number of items a path reads is worked out from the operations
+    in it as it is compiled."""
+
+    def __init__(self,interpreter):
+        """Initializes new MemoEngine."""
+        fusion.FusedEngine.__init__(self,interpreter)
+        self.cache = RegionCache()
+
+    def compile_path(self,start):
+        """Compiles the path starting from a state, with a function that
+        looks its results up in the cache."""
+        path = fusion.FusedEngine.compile_path(self,start)
+        if path != None:
+            path.function = self.cache.memoize(start,path.function,path.reads)
+        return path
+
+    def stats(self):
+        """Gets the statistics of the engine as a list of (name, value) pairs."""
+        return fusion.FusedEngine.stats(self) + self.cache.stats()
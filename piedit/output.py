@@ -0,0 +1,137 @@
+"""Places the output of a Piet program can go, and how it is buffered"""
+
+import sys
+
+__author__ = "Steven Anderson"
+__copyright__ = "Steven Anderson 2008"
+__credits__ = ["Steven Anderson"]
+__license__ = "GPL"
+__version__ = "0.0.1"
+__maintainer__ = "Steven Anderson"
+__email__ = "steven.james.anderson@googlemail.com"
+__status__ = "Production"
+
+#Buffering modes. Block buffered output is passed on when the buffer is
+#full, line buffered output at the end of each line as well, and unbuffered
+#output as soon as it is written.
+BLOCK = "block"
+LINE = "line"
+UNBUFFERED = "none"
+modes = [BLOCK,LINE,UNBUFFERED]
+#Characters held by a buffer before it is passed on
+BUFFER_SIZE = 8192
+
+
+class Sink(object):
+    """Base class of the places output goes. Output written to a sink is
+    held in a buffer as the mode says, and passed on to emit when it is
+    flushed. The interpreter flushes its sink before it reads input and
+    when the program stops."""
+
+    def __init__(self,mode=BLOCK,buffer_size=BUFFER_SIZE):
+        """Initializes new Sink."""
+        self.mode = mode
+        self.buffer_size = buffer_size
+        self.pending = []
+        self.pending_size = 0
+
+    def write(self,text):
+        """Writes output to the sink."""
+        if self.mode == UNBUFFERED:
+            self.emit(text)
+            return
+        self.pending.append(text)
+        self.pending_size = self.pending_size + len(text)
+        if self.pending_size >= self.buffer_size or (self.mode == LINE and "\n" in text):
+            self.flush()
+
+    def flush(self):
+        """Passes on the output held in the buffer."""
+        if self.pending:
+            text = "".join(self.pending)
+            self.pending = []
+            self.pending_size = 0
+            self.emit(text)
+
+    def close(self):
+        """Flushes the sink, and closes what it writes to if it opened it."""
+        self.flush()
+
+    def emit(self,text):
+        """Passes output on. Subclasses must override it."""
+        raise NotImplementedError
+
+
+class StreamSink(Sink):
+    """Sink that writes to a file-like object, flushing it each time output
+    is passed on."""
+
+    def __init__(self,stream,mode=BLOCK,buffer_size=BUFFER_SIZE):
+        """Initializes new StreamSink."""
+        Sink.__init__(self,mode,buffer_size)
+        self.stream = stream
+
+    def emit(self,text):
+        self.stream.write(text)
+        self.stream.flush()
+
+
+class StdoutSink(StreamSink):
+    """Sink that writes to whatever sys.stdout is when output is passed on.
+    It is line buffered if stdout is a terminal, so a person watching sees
+    each line as it is finished, and block buffered otherwise."""
+
+    def __init__(self,mode=None,buffer_size=BUFFER_SIZE):
+        """Initializes new StdoutSink."""
+        if mode == None:
+            mode = BLOCK
+            if hasattr(sys.stdout,"isatty") and sys.stdout.isatty():
+                mode = LINE
+        StreamSink.__init__(self,None,mode,buffer_size)
+
+    def emit(self,text):
+        sys.stdout.write(text)
+        sys.stdout.flush()
+
+
+class FileSink(StreamSink):
+    """Sink that writes to a file it opens at the given path."""
+
+    def __init__(self,path,mode=BLOCK,buffer_size=BUFFER_SIZE):
+        """Initializes new FileSink."""
+        StreamSink.__init__(self,open(path,"wb"),mode,buffer_size)
+
+    def close(self):
+        StreamSink.close(self)
+        self.stream.close()
+
+
+class MemorySink(Sink):
+    """Sink that keeps the output in memory, for callers that want it as a
+    string. Nothing is held back from getvalue whatever the mode."""
+
+    def __init__(self,mode=BLOCK,buffer_size=BUFFER_SIZE):
+        """Initializes new MemorySink."""
+        Sink.__init__(self,mode,buffer_size)
+        self.chunks = []
+
+    def emit(self,text):
+        self.chunks.append(text)
+
+    def getvalue(self):
+        """Gets all the output written so far."""
+        self.flush()
+        return "".join(self.chunks)
+
+
+class CallbackSink(Sink):
+    """Sink that passes output on to a function taking a string, such as
+    one that shows it in the UI."""
+
+    def __init__(self,callback,mode=BLOCK,buffer_size=BUFFER_SIZE):
+        """Initializes new CallbackSink."""
+        Sink.__init__(self,mode,buffer_size)
+        self.callback = callback
+
+    def emit(self,text):
+        self.callback(text)
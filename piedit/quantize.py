@@ -0,0 +1,101 @@
+"""Maps the pixels of noisy, transparent or off palette images to Piet colors"""
+
+import PIL.ImageChops
+import PIL.ImageMath
+import colors
+
+__author__ = "Steven Anderson"
+__copyright__ = "Steven Anderson 2008"
+__credits__ = ["Steven Anderson"]
+__license__ = "GPL"
+__version__ = "0.0.1"
+__maintainer__ = "Steven Anderson"
+__email__ = "steven.james.anderson@googlemail.com"
+__status__ = "Production"
+
+#What is done with a pixel that isn't within the tolerance of a Piet color.
+#"nearest" maps every pixel to its nearest color, whatever the tolerance.
+NEAREST = "nearest"
+WHITE = "white"
+BLACK = "black"
+ERROR = "error"
+policies = [NEAREST,WHITE,BLACK,ERROR]
+
+#What is done with transparent pixels. "ignore" uses their color as it is.
+IGNORE = "ignore"
+alpha_policies = [IGNORE,WHITE,BLACK]
+#Pixels with less alpha than this are transparent
+ALPHA_THRESHOLD = 128
+
+channel_values = [0x00,0xC0,0xFF]
+
+def is_default(unknown=WHITE,tolerance=0,alpha=IGNORE):
+    """Tells us whether the settings give what colors.image_to_indices gives,
+    which treats every color that isn't a Piet color as white."""
+    return unknown == WHITE and tolerance == 0 and alpha == IGNORE
+
+def has_alpha(image):
+    """Tells us whether a PIL image has an alpha channel or a transparent color."""
+    return image.mode in ["RGBA","LA","PA"] or image.info.has_key("transparency")
+
+def count(mask):
+    """Counts the pixels set in a mask of 0 and 255."""
+    return mask.histogram()[255]
+
+def nearest_colors(image):
+    """Finds the nearest Piet color to every pixel of an RGB image, by
+    squared distance in RGB. Returns an "I" image of palette indices and
+    an "I" image of the squared distances. Every step works on the whole
+    image at once in PIL: the distance of each channel to each of its three
+    values is worked out once, and each color adds up three of them."""
+    bands = image.split()
+    distances = [[PIL.ImageMath.eval("(v-%d)*(v-%d)" % (value,value),v=band) for value in channel_values] for band in bands]
+    indices = None
+    for index,rgb in enumerate(colors.palette_rgb):
+        r, g, b = [distances[channel][channel_values.index(value)] for channel,value in enumerate(rgb)]
+        distance = PIL.ImageMath.eval("r+g+b",r=r,g=g,b=b)
+        if indices == None:
+            indices = PIL.ImageMath.eval("d*0",d=distance)
+            nearest = distance
+        else:
+            #Ties go to the color earlier in the palette
+            indices = PIL.ImageMath.eval("(d<n)*%d+(d>=n)*i" % (index),d=distance,n=nearest,i=indices)
+            nearest = PIL.ImageMath.eval("min(d,n)",d=distance,n=nearest)
+    return (indices, nearest)
+
+def to_mask(image):
+    """Converts an "I" image of 0 and 1 to an "L" mask of 0 and 255."""
+    return image.convert("L").point([0]+[255]*255)
+
+def image_to_indices(image,unknown=WHITE,tolerance=0,alpha=IGNORE):
+    """Converts a PIL image of any mode to a bytearray of palette indices,
+    one per pixel in row order, like colors.image_to_indices. Pixels within
+    tolerance (a distance in RGB) of a Piet color are mapped to the nearest
+    one, and the rest are dealt with by the unknown policy. Transparent
+    pixels are made white or black by the alpha policy. Returns the indices
+    and the number of pixels that weren't exactly a Piet color, or were
+    transparent. Raises IOError if the policy is "error" and a pixel isn't
+    within tolerance."""
+    transparent = None
+    if alpha != IGNORE and has_alpha(image):
+        alpha_band = image.convert("RGBA").split()[3]
+        transparent = alpha_band.point([255]*ALPHA_THRESHOLD+[0]*(256-ALPHA_THRESHOLD))
+    if image.mode != "RGB":
+        image = image.convert("RGB")
+    indices, nearest = nearest_colors(image)
+    result = indices.convert("L")
+    remapped = to_mask(PIL.ImageMath.eval("n>0",n=nearest))
+
+    if unknown != NEAREST:
+        far = to_mask(PIL.ImageMath.eval("n>%d" % (tolerance*tolerance),n=nearest))
+        if transparent != None:
+            #Transparent pixels get their color from the alpha policy
+            far = PIL.ImageChops.subtract(far,transparent)
+        if unknown == ERROR and count(far):
+            raise IOError, "UNKNOWN_COLORS (%d pixels aren't within %s of a Piet color)" % (count(far),tolerance)
+        result.paste(colors.white_index if unknown == WHITE else colors.black_index,None,far)
+
+    if transparent != None:
+        result.paste(colors.white_index if alpha == WHITE else colors.black_index,None,transparent)
+        remapped = PIL.ImageChops.lighter(remapped,transparent)
+    return (bytearray(result.tobytes()), count(remapped))
@@ -0,0 +1,105 @@
+"""The operand stack of the interpreter, kept compact while its items are small"""
+
+from array import array
+
+__author__ = "Steven Anderson"
+__copyright__ = "Steven Anderson 2008"
+__credits__ = ["Steven Anderson"]
+__license__ = "GPL"
+__version__ = "0.0.1"
+__maintainer__ = "Steven Anderson"
+__email__ = "steven.james.anderson@googlemail.com"
+__status__ = "Production"
+
+#Type code of the array items are kept in while they fit, a 64 bit integer
+#on the machines Piedit runs on
+TYPECODE = "l"
+
+
+class Stack(object):
+    """Class that holds the items of the stack in an array of machine
+    integers, 8 bytes each instead of a pointer and an int object, until an
+    item too big for one is put on it. Then the items are moved to a list,
+    which holds any size of integer, for the rest of the run. It acts like
+    the list the stack used to be: items are appended to and popped from
+    the end, and indices and slices count from the bottom. Slices of the
+    stack are arrays while it is compact, so Roll and Duplicate copy items
+    without making an object for each."""
+
+    def __init__(self,items=()):
+        """Initializes new Stack holding the given items, bottom first."""
+        self.items = array(TYPECODE)
+        self.pop = self.items.pop
+        self.extend(items)
+
+    def promote(self):
+        """Moves the items to a list, once one doesn't fit in the array."""
+        if isinstance(self.items,array):
+            self.items = self.items.tolist()
+            self.pop = self.items.pop
+
+    def compact(self,items):
+        """Gets the given items as an array if the stack is still compact and
+        they all fit in one, promoting the stack if they don't."""
+        if not isinstance(self.items,array) or isinstance(items,array):
+            return items
+        try:
+            return array(TYPECODE,items)
+        except OverflowError:
+            self.promote()
+            return items
+
+    def append(self,item):
+        """Puts an item on top of the stack."""
+        try:
+            self.items.append(item)
+        except OverflowError:
+            self.promote()
+            self.items.append(item)
+
+    def extend(self,items):
+        """Puts the given items on top of the stack, the last on top."""
+        items = self.compact(items)
+        self.items.extend(items)
+
+    def replace_top(self,taken,items):
+        """Replaces the top taken items of the stack with the given list of
+        items, as compiled code writes the stack back."""
+        if isinstance(self.items,array):
+            try:
+                items = array(TYPECODE,items)
+            except OverflowError:
+                self.promote()
+        self.items[len(self.items)-taken:] = items
+
+    def __len__(self):
+        return len(self.items)
+
+    def __getitem__(self,index):
+        return self.items[index]
+
+    def __setitem__(self,index,value):
+        if isinstance(index,slice):
+            value = self.compact(value)
+            self.items[index] = value
+        else:
+            try:
+                self.items[index] = value
+            except OverflowError:
+                self.promote()
+                self.items[index] = value
+
+    def __delitem__(self,index):
+        del self.items[index]
+
+    def __iter__(self):
+        return iter(self.items)
+
+    def __eq__(self,other):
+        return list(self.items) == list(other)
+
+    def __ne__(self,other):
+        return not self == other
+
+    def __repr__(self):
+        return repr(list(self.items))
@@ -0,0 +1,132 @@
+"""Labels the color blocks of very large programs on several cores"""
+
+import ctypes
+import multiprocessing
+from multiprocessing import sharedctypes
+from array import array
+import colors
+import unionfind
+import grid
+
+__author__ = "Steven Anderson"
+__copyright__ = "Steven Anderson 2008"
+__credits__ = ["Steven Anderson"]
+__license__ = "GPL"
+__version__ = "0.0.1"
+__maintainer__ = "Steven Anderson"
+__email__ = "steven.james.anderson@googlemail.com"
+__status__ = "Production"
+
+#Shared buffers of the current pool, set in each worker by init_worker
+shared_codels = None
+shared_labels = None
+shared_width = None
+
+def label_blocks(codel_grid,jobs):
+    """Labels the color blocks of a grid in the same way as grid.label_blocks,
+    using a pool of jobs worker processes. The rows are split into bands and
+    each band is labeled by a worker, then the labels are joined across the
+    seams between bands. Codels and labels live in shared memory, so no band
+    is ever copied between processes. The labels, sizes and ColorBlock
+    objects are exactly the same as those of grid.label_blocks."""
+    width, height = codel_grid.width, codel_grid.height
+    size = width*height
+    codels = sharedctypes.RawArray('B',size)
+    ctypes.memmove(codels,(ctypes.c_char*size).from_buffer(codel_grid.codels),size)
+    labels = sharedctypes.RawArray('i',size)
+    #Every byte 0xff makes every label -1, as for white and black codels
+    ctypes.memset(labels,0xff,ctypes.sizeof(labels))
+    bands = split_rows(height,jobs)
+
+    pool = multiprocessing.Pool(len(bands),init_worker,(codels,labels,width))
+    try:
+        band_blocks = pool.map(label_band,bands)
+
+        #Give every band its own range of labels
+        offsets = [0]
+        for color_blocks in band_blocks:
+            offsets.append(offsets[-1]+len(color_blocks))
+        sets = unionfind.UnionFind(offsets[-1])
+
+        #Join the labels of runs that touch across a seam
+        for band in xrange(1,len(bands)):
+            seam = bands[band][0]
+            runs = grid.find_runs(codels,width,seam-1,seam+1)
+            run_starts, run_ends, run_labels, seam_sets = runs
+            first_labels = {}
+            for start,label in zip(run_starts,run_labels):
+                root = seam_sets.find(label)
+                if start < seam*width:
+                    label = offsets[band-1]+labels[start]
+                else:
+                    label = offsets[band]+labels[start]
+                if first_labels.has_key(root):
+                    sets.union(first_labels[root],label)
+                else:
+                    first_labels[root] = label
+
+        #Final labels, numbered in the order the blocks are first met
+        final_labels = array('i',[-1])*len(sets)
+        mapping = array('i',[-1])*len(sets)
+        next_label = 0
+        for label in xrange(len(sets)):
+            root = sets.find(label)
+            if final_labels[root] == -1:
+                final_labels[root] = next_label
+                next_label = next_label + 1
+            mapping[label] = final_labels[root]
+
+        pool.map(relabel_band,[(first_row,last_row,mapping[offsets[band]:offsets[band+1]])
+            for band,(first_row,last_row) in enumerate(bands)])
+    finally:
+        pool.close()
+        pool.join()
+
+    color_blocks = {}
+    for band,band_color_blocks in enumerate(band_blocks):
+        for label in xrange(len(band_color_blocks)):
+            final_label = mapping[offsets[band]+label]
+            if color_blocks.has_key(final_label):
+                color_blocks[final_label].merge(band_color_blocks[label])
+            else:
+                color_blocks[final_label] = band_color_blocks[label]
+
+    codel_grid.labels = array('i')
+    codel_grid.labels.fromstring(buffer(labels))
+    codel_grid.sizes = array('i',(color_blocks[label].size for label in xrange(len(color_blocks))))
+    return color_blocks
+
+def split_rows(height,jobs):
+    """Splits the rows of an image into at most jobs bands of about the
+    same height. Returns a list of (first row, last row + 1) pairs."""
+    jobs = max(1,min(jobs,height))
+    bounds = [height*band//jobs for band in xrange(jobs+1)]
+    return zip(bounds[:-1],bounds[1:])
+
+def init_worker(codels,labels,width):
+    """Stores the shared buffers in a worker process."""
+    global shared_codels, shared_labels, shared_width
+    shared_codels = codels
+    shared_labels = labels
+    shared_width = width
+
+def label_band(band):
+    """Labels one band of rows in a worker. The labels written to the shared
+    buffer start from 0 in every band. Returns the band's ColorBlock objects."""
+    first_row, last_row = band
+    runs = grid.find_runs(shared_codels,shared_width,first_row,last_row)
+    sizes, color_blocks = grid.assign_labels(runs,shared_width,shared_labels)
+    return color_blocks
+
+def relabel_band(band):
+    """Replaces the labels of one band of rows with their final labels."""
+    first_row, last_row, mapping = band
+    width = shared_width
+    for y in xrange(first_row,last_row):
+        for run in grid.run_pattern.finditer(buffer(shared_codels,y*width,width)):
+            color = ord(run.group(1))
+            if colors.is_white(color) or colors.is_black(color):
+                continue
+            start, end = run.span()
+            start, end = y*width+start, y*width+end
+            shared_labels[start:end] = array('i',[mapping[shared_labels[start]]])*(end-start)
@@ -0,0 +1,320 @@
+#!/usr/bin/env python
+
+"""Structured tracing of the interpreter. Events are recorded as fixed size
+binary records in a ring buffer, and only formatted when they are printed,
+so tracing that is turned off costs a test of the level.
+
+A trace file is a header, then the records oldest first, then the strings
+the records refer to. All numbers are little endian.
+
+    Header      magic "PTRC", version (byte), level (byte), 2 bytes unused,
+                number of events recorded (64 bit), number of records kept,
+                number of strings (32 bit)
+    Records     event code (byte), 7 bytes unused, step, 6 arguments
+                (all 64 bit)
+    Strings     length (32 bit) then the bytes of each string"""
+
+import sys
+import getopt
+import struct
+import colors
+
+__author__ = "Steven Anderson"
+__copyright__ = "Steven Anderson 2008"
+__credits__ = ["Steven Anderson"]
+__license__ = "GPL"
+__version__ = "0.0.1"
+__maintainer__ = "Steven Anderson"
+__email__ = "steven.james.anderson@googlemail.com"
+__status__ = "Production"
+
+MAGIC = "PTRC"
+VERSION = 1
+header_format = struct.Struct("<4sBBxxqII")
+record_format = struct.Struct("<B7xq6q")
+string_length_format = struct.Struct("<I")
+#Records kept in the ring buffer by default, 4MB of them
+RING_SIZE = 65536
+
+#Levels. An event is recorded if its level is no more than the tracer's.
+OFF = 0
+PHASE = 1
+STEP = 2
+STACK = 3
+ALL = STACK
+
+#Event codes
+LOADING = 1
+LOADED = 2
+REMAPPED = 3
+SCANNING = 4
+COLOR_BLOCK = 5
+BOUNDARY = 6
+SCANNED = 7
+STARTING = 8
+AT = 9
+MOVE_WITHIN = 10
+MOVE_OUT = 11
+TRY_CROSS = 12
+CROSS = 13
+STACK_BEFORE = 14
+PERFORM = 15
+STACK_AFTER = 16
+HIT = 17
+TOGGLE_CC = 18
+ROTATE_DP = 19
+FINISHED = 20
+MAX_STEPS = 21
+STOPPED = 22
+WHITE_CYCLE = 23
+
+#Level, format and the kinds of the arguments of each event. Kinds are i for
+#a number, s for a string, c for a palette index, o for an operation code,
+#d for a direction of the DP and k for the depth and top three items of the
+#stack, which take four arguments.
+events = {
+    LOADING: (PHASE, "---LOADING IMAGE %s...---", "s"),
+    LOADED: (PHASE, "---IMAGE LOADED (Codel Size %d)---\n", "i"),
+    REMAPPED: (PHASE, "---%d PIXELS REMAPPED---", "i"),
+    SCANNING: (PHASE, "---SCANNING COLOR BLOCKS---", ""),
+    COLOR_BLOCK: (PHASE, "Color Block %d: Size=%d,", "ii"),
+    BOUNDARY: (PHASE, "\tmax%sL=(%d,%d), max%sR=(%d,%d)", "diidii"),
+    SCANNED: (PHASE, "---COLOR BLOCKS SCANNED---\n", ""),
+    STARTING: (PHASE, "---STARTING EXECUTION---", ""),
+    AT: (STEP, "AT (%d,%d), COLOR=%s, DP=%d, CC=%d", "iicii"),
+    MOVE_WITHIN: (STEP, "  -> Moving within color block...", ""),
+    MOVE_OUT: (STEP, "  -> Moving out of color block...", ""),
+    TRY_CROSS: (STEP, "  -> Trying to cross from (%d,%d) to (%d,%d)", "iiii"),
+    CROSS: (STEP, "  -> Crossing from (%d,%d), color=%s to (%d,%d), color=%s", "iiciic"),
+    STACK_BEFORE: (STACK, "  -> Stack before %s = %s", "ok"),
+    PERFORM: (STEP, "  -> Performing %s", "o"),
+    STACK_AFTER: (STACK, "  -> Stack after %s = %s", "ok"),
+    HIT: (STEP, "  -> Hit an obstruction\n  -> Obstructions Hit = %d", "i"),
+    TOGGLE_CC: (STEP, "  -> Toggling CC", ""),
+    ROTATE_DP: (STEP, "  -> Rotating DP by %s", "i"),
+    FINISHED: (PHASE, "---EXECUTION FINISHED---", ""),
+    MAX_STEPS: (PHASE, "---EXECUTION FINISHED (Max Steps Reached)---", ""),
+    STOPPED: (PHASE, "\n---EXECUTION FINISHED (Thread was stopped)---", ""),
+    WHITE_CYCLE: (PHASE, "---GOES ROUND THROUGH WHITE FOR EVER FROM (%d,%d)---", "ii"),
+}
+
+#Names of the operations, indexed by operation code as Interpreter.operations
+operation_names = ["None","Push","Pop","Add","Subtract","Multiply","Divide",
+    "Mod","Not","Greater","Pointer","Switch","Duplicate","Roll",
+    "IN(Number)","IN(char)","OUT(Number)","OUT(Char)"]
+direction_names = "RDLU"
+
+#Stands in for numbers too big for a record
+TOO_BIG = -2**63
+
+def fit(value):
+    """Gets a number that can be recorded, which is TOO_BIG if it doesn't fit
+    in 64 bits."""
+    if -2**63 < value < 2**63:
+        return value
+    return TOO_BIG
+
+def stack_args(stack):
+    """Gets the four arguments recording the depth and top three items of a
+    stack, without looking at the rest of it."""
+    top = [fit(item) for item in stack[-3:]]
+    return [len(stack)] + [0]*(3-len(top)) + top
+
+def format_number(value):
+    """Formats a recorded number."""
+    if value == TOO_BIG:
+        return "<big>"
+    return str(value)
+
+def format_stack(args):
+    """Formats the depth and top three items of a stack."""
+    depth = args[0]
+    items = [format_number(item) for item in args[4-min(depth,3):4]]
+    if depth > 3:
+        items = ["..."] + items
+    return "[%s] (depth %d)" % (", ".join(items),depth)
+
+def format_event(code,args,strings):
+    """Expands the arguments of an event into its message."""
+    level, message, kinds = events[code]
+    values = []
+    args = list(args)
+    for kind in kinds:
+        if kind == "k":
+            values.append(format_stack(args[:4]))
+            args = args[4:]
+            continue
+        value = args.pop(0)
+        if kind == "s":
+            values.append(strings[value])
+        elif kind == "c":
+            values.append(colors.colors[value])
+        elif kind == "o":
+            values.append(operation_names[value].upper())
+        elif kind == "d":
+            values.append(direction_names[value])
+        elif kind == "i" and value == TOO_BIG:
+            values.append(format_number(value))
+        else:
+            values.append(value)
+    return message % tuple(values)
+
+
+class Tracer(object):
+    """Class that records the events of the interpreter up to a level in a
+    ring buffer, keeping the latest size of them, and echoes events up to a
+    level to a stream as they happen. Callers test the level before building
+    the arguments of an event, so nothing is done when tracing is off."""
+
+    def __init__(self):
+        """Initializes new Tracer, which is off."""
+        #Highest level of event anything is done with
+        self.level = OFF
+        self.record_level = OFF
+        self.echo_level = OFF
+        self.echo = None
+        self.buffer = None
+        self.size = 0
+        #Number of events recorded, including ones overwritten since
+        self.count = 0
+        self.strings = []
+        self.string_ids = {}
+
+    def record(self,level=ALL,size=RING_SIZE):
+        """Starts recording events up to a level in a ring buffer of size records."""
+        self.record_level = level
+        self.size = size
+        self.buffer = bytearray(size*record_format.size)
+        self.count = 0
+        self.level = max(self.record_level,self.echo_level)
+
+    def echo_to(self,stream,level=ALL):
+        """Echoes events up to a level to a stream, or stops if it is None."""
+        self.echo = stream
+        self.echo_level = level
+        if stream == None:
+            self.echo_level = OFF
+        self.level = max(self.record_level,self.echo_level)
+
+    def event(self,code,step,a=0,b=0,c=0,d=0,e=0,f=0):
+        """Records and echoes an event, as far as the levels take it in."""
+        level = events[code][0]
+        if level > self.level:
+            return
+        if level <= self.record_level:
+            record_format.pack_into(self.buffer,(self.count%self.size)*record_format.size,code,step,a,b,c,d,e,f)
+            self.count = self.count + 1
+        if level <= self.echo_level:
+            self.echo.write(format_event(code,(a,b,c,d,e,f),self.strings)+"\n")
+
+    def string(self,text):
+        """Gets the id of a string, to be given to an event."""
+        if not self.string_ids.has_key(text):
+            self.string_ids[text] = len(self.strings)
+            self.strings.append(text)
+        return self.string_ids[text]
+
+    def records(self):
+        """Generator of the records kept, oldest first, as (code, step, args)."""
+        kept = min(self.count,self.size)
+        for i in xrange(self.count-kept,self.count):
+            record = record_format.unpack_from(self.buffer,(i%self.size)*record_format.size)
+            yield (record[0], record[1], record[2:])
+
+    def save(self,path):
+        """Saves the records kept as a trace file."""
+        kept = min(self.count,self.size)
+        trace_file = open(path,"wb")
+        try:
+            trace_file.write(header_format.pack(MAGIC,VERSION,self.record_level,self.count,
+                kept,len(self.strings)))
+            if kept:
+                start = (self.count-kept)%self.size*record_format.size
+                end = start+kept*record_format.size
+                trace_file.write(buffer(self.buffer,start,end-start))
+                if end > len(self.buffer):
+                    #The ring has wrapped round
+                    trace_file.write(buffer(self.buffer,0,end-len(self.buffer)))
+            for text in self.strings:
+                trace_file.write(string_length_format.pack(len(text)))
+                trace_file.write(text)
+        finally:
+            trace_file.close()
+
+def load(path):
+    """Loads a trace file. Returns the number of events recorded, a list of
+    the records kept as (code, step, args), and the strings."""
+    trace_file = open(path,"rb")
+    try:
+        data = trace_file.read()
+    finally:
+        trace_file.close()
+    if len(data) < header_format.size:
+        raise IOError, "TRACE_FILE_TRUNCATED"
+    magic, version, level, count, kept, string_count = header_format.unpack_from(data)
+    if magic != MAGIC or version != VERSION:
+        raise IOError, "NOT_A_TRACE_FILE"
+    offset = header_format.size
+    if len(data) < offset+kept*record_format.size:
+        raise IOError, "TRACE_FILE_TRUNCATED"
+    records = []
+    for i in xrange(kept):
+        record = record_format.unpack_from(data,offset)
+        records.append((record[0], record[1], record[2:]))
+        offset = offset + record_format.size
+    strings = []
+    for i in xrange(string_count):
+        (length,) = string_length_format.unpack_from(data,offset)
+        offset = offset + string_length_format.size
+        strings.append(data[offset:offset+length])
+        offset = offset + length
+    return (count, records, strings)
+
+def print_trace(path,show_steps=False,level=ALL):
+    """Prints the events of a trace file up to a level."""
+    count, records, strings = load(path)
+    if count > len(records):
+        print "(%d earlier events were overwritten)" % (count-len(records))
+    for code, step, args in records:
+        if events[code][0] > level:
+            continue
+        message = format_event(code,args,strings)
+        if show_steps:
+            message = "%d: %s" % (step,message)
+        print message
+
+def print_usage():
+    """Prints usage string for command line."""
+    print "Piedit v0.0.1 - Python Piet IDE\n"
+    print "Usage: tracing.py [<options>] <trace filename>"
+    print "Prints the events in a trace file written by interpreter.py --trace."
+    print "options:"
+    print "\t-h (--help)\t- Prints this help"
+    print "\t-n (--steps)\t- Prints the step of each event."
+    print "\t-v (--level)\t- Prints only events up to a level: 1 for loading and finishing, 2 for each step, 3 for the stack too (by default)."
+
+#Print the trace if on command line
+if __name__ == "__main__":
+    try:
+        opts,args = getopt.getopt(sys.argv[1:], "hnv:", ["help","steps","level="])
+    except getopt.GetoptError, err:
+        print str(err)
+        print_usage()
+        sys.exit(2)
+    show_steps = False
+    level = ALL
+    for o,a in opts:
+        if o in ["-h","--help"]:
+            print_usage()
+            sys.exit(1)
+        elif o in ["-n","--steps"]:
+            show_steps = True
+        elif o in ["-v","--level"]:
+            level = int(a)
+    if len(args) != 1:
+        print_usage()
+        sys.exit(2)
+    try:
+        print_trace(args[0],show_steps,level)
+    except IOError, err:
+        raise SystemExit("\nError: "+str(err))
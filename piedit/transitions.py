@@ -0,0 +1,225 @@
+"""Transition table of a Piet program, compiled before it is run"""
+
+from array import array
+import colors
+
+__author__ = "Steven Anderson"
+__copyright__ = "Steven Anderson 2008"
+__credits__ = ["Steven Anderson"]
+__license__ = "GPL"
+__version__ = "0.0.1"
+__maintainer__ = "Steven Anderson"
+__email__ = "steven.james.anderson@googlemail.com"
+__status__ = "Production"
+
+#Next states that don't lead to another color block
+BLOCKED = -1
+WHITE = -2
+FINISHED = -3
+#Layout of a TransitionTable, which is pickled in the cache of compiled
+#programs. Bump it whenever the attributes of the table change.
+FORMAT = 1
+
+def state_id(label,dp,cc):
+    """Gets the integer ID of the state of being in a color block with the
+    given DP and CC."""
+    return label*8+dp*2+cc
+
+def split_state(state):
+    """Gets the (label, dp, cc) of a state ID."""
+    return (state>>3, (state>>1)&3, state&1)
+
+
+class TransitionTable(object):
+    """Class that holds what happens when the interpreter leaves each color
+    block in each of the 8 DP and CC states. This is worked out once for the
+    whole program, so running it is a table lookup per color block.
+
+    Everything is kept in flat arrays indexed by state ID. Codels are given
+    as flat indices, y*width+x.
+
+    When a state is blocked, the interpreter tries the other DP and CC states
+    in turn until one isn't blocked, or all 8 are. Which one works is worked
+    out once, so getting round a blocked edge is one lookup too.
+
+    Leaving a color block into white is followed right away through the
+    white, so it also leads to a color block, or ends the program. The
+    states that go round through white for ever without doing anything are
+    kept in white_cycles."""
+
+    def __init__(self,grid,color_blocks):
+        """Compiles the TransitionTable of a labeled grid."""
+        self.width = grid.width
+        count = len(grid.sizes)*8
+        #The boundary codel the block is left from
+        self.exits = array('i',[-1])*count
+        #The codel entered, -1 if blocked
+        self.entries = array('i',[-1])*count
+        #The operation code, 0 for none
+        self.ops = array('b',[0])*count
+        #The state entered, or BLOCKED or WHITE
+        self.next_states = array('i',[BLOCKED])*count
+        for label,color_block in color_blocks.items():
+            for dp in xrange(4):
+                for cc in xrange(2):
+                    self.compile_state(grid,label,dp,cc,color_block.boundary_pixels[dp][cc])
+
+        #The first state tried that isn't blocked, or FINISHED, for blocked states
+        self.retry_states = array('i',[-1])*count
+        #The steps taken by the tries that are blocked
+        self.retry_steps = array('i',[0])*count
+        for state in xrange(count):
+            if self.next_states[state] == BLOCKED:
+                self.compile_retries(state)
+
+        #Where each slide through white stops, indexed by codel*4+dp
+        self.slides = {}
+        #What happens after going into white, indexed by state ID
+        self.white_paths = {}
+        for state in xrange(count):
+            if self.next_states[state] == WHITE:
+                label, dp, cc = split_state(state)
+                self.white_paths[state] = self.white_path(grid,self.entries[state],dp,cc)
+        #The states of each cycle through white, and the steps the cycle takes
+        self.white_cycles = self.find_white_cycles()
+        self.cycle_steps = {}
+        for cycle in self.white_cycles:
+            steps = sum(2+self.white_paths[state][0] for state in cycle)
+            for state in cycle:
+                self.cycle_steps[state] = steps
+
+    def compile_state(self,grid,label,dp,cc,exit_pixel):
+        """Works out where the interpreter goes when it leaves a color block
+        from the given boundary pixel."""
+        state = state_id(label,dp,cc)
+        x,y = exit_pixel
+        self.exits[state] = y*grid.width+x
+        n_x,n_y = ((x+1,y),(x,y+1),(x-1,y),(x,y-1))[dp]
+        if n_x < 0 or n_y < 0 or n_x >= grid.width or n_y >= grid.height:
+            return
+        entry = n_y*grid.width+n_x
+        next_color = grid.codels[entry]
+        if colors.is_black(next_color):
+            return
+        self.entries[state] = entry
+        if colors.is_white(next_color):
+            self.next_states[state] = WHITE
+        else:
+            self.ops[state] = colors.transitions[grid.codels[y*grid.width+x]][next_color]
+            self.next_states[state] = state_id(grid.labels[entry],dp,cc)
+
+    def resolve(self,state,through_cycles=False):
+        """Follows the transition from a state through any blocked tries and
+        any white. Returns (operation, steps, next state, codel entered), or
+        None if the program ends, or goes round a white cycle unless
+        through_cycles is set. The next state is the one before a Pointer or
+        Switch is done."""
+        steps = 0
+        if self.next_states[state] == BLOCKED:
+            if self.retry_states[state] == FINISHED:
+                return None
+            steps = self.retry_steps[state]
+            state = self.retry_states[state]
+        next_state = self.next_states[state]
+        if next_state == WHITE:
+            if self.cycle_steps.has_key(state) and not through_cycles:
+                return None
+            white_steps, position, dp, cc, times_stopped, switch_cc, next_state = self.white_paths[state]
+            if next_state == FINISHED:
+                return None
+            return (0, steps+2+white_steps, next_state, position)
+        return (self.ops[state], steps+2, next_state, self.entries[state])
+
+    def compile_retries(self,state):
+        """Works out which DP and CC the interpreter goes on with after the
+        given state is blocked. The CC is toggled and the DP rotated by turns,
+        starting with the CC, and 8 blocked tries end the program."""
+        retry_state = state
+        for tries in xrange(1,8):
+            if tries%2 == 1:
+                retry_state = retry_state ^ 1
+            else:
+                retry_state = (retry_state & ~6) | ((retry_state+2) & 6)
+            if self.next_states[retry_state] != BLOCKED:
+                self.retry_states[state] = retry_state
+                self.retry_steps[state] = tries*2
+                return
+        self.retry_states[state] = FINISHED
+        self.retry_steps[state] = 16
+
+    def slide(self,grid,start,dp):
+        """Slides from a white codel in the direction of the DP. Returns the
+        last white codel and the codel after it, which is -1 at the edge of
+        the program. Every codel passed is cached, so each codel is only
+        slid over once in each direction."""
+        key = start*4+dp
+        if self.slides.has_key(key):
+            return self.slides[key]
+        width, height = grid.width, grid.height
+        step = (1,width,-1,-width)[dp]
+        path = []
+        codel = start
+        while True:
+            path.append(codel)
+            x, y = codel%width, codel//width
+            if (dp == 0 and x == width-1) or (dp == 1 and y == height-1)\
+                or (dp == 2 and x == 0) or (dp == 3 and y == 0):
+                next_codel = -1
+                break
+            next_codel = codel+step
+            if not colors.is_white(grid.codels[next_codel]):
+                break
+            if self.slides.has_key(next_codel*4+dp):
+                codel, next_codel = self.slides[next_codel*4+dp]
+                break
+            codel = next_codel
+        for passed in path:
+            self.slides[passed*4+dp] = (codel, next_codel)
+        return (codel, next_codel)
+
+    def white_path(self,grid,entry,dp,cc):
+        """Follows the interpreter through white from the codel it went into,
+        trying the other DP and CC states as it hits obstructions. Returns
+        (steps, codel, dp, cc, times stopped, switch cc, next state), where
+        the next state is FINISHED if the program ends in the white."""
+        codel = entry
+        steps = 0
+        times_stopped = 0
+        switch_cc = True
+        while True:
+            codel, next_codel = self.slide(grid,codel,dp)
+            steps = steps + 1
+            if next_codel != -1:
+                steps = steps + 1
+                if not colors.is_black(grid.codels[next_codel]):
+                    return (steps, next_codel, dp, cc, 0, True,
+                        state_id(grid.labels[next_codel],dp,cc))
+            #Obstructed by the edge or by black
+            times_stopped = times_stopped + 1
+            if times_stopped >= 8:
+                return (steps, codel, dp, cc, times_stopped, switch_cc, FINISHED)
+            if switch_cc:
+                cc = 1-cc
+            else:
+                dp = (dp+1)%4
+            switch_cc = not switch_cc
+
+    def find_white_cycles(self):
+        """Finds the cycles of states that only go through white from one
+        color block to the next. These do nothing, so a program that gets
+        into one runs for ever."""
+        cycles = []
+        #1 for states on the current path, 2 for states done
+        seen = {}
+        for start in self.white_paths:
+            path = []
+            state = start
+            while self.white_paths.has_key(state) and not seen.has_key(state):
+                seen[state] = 1
+                path.append(state)
+                state = self.white_paths[state][6]
+            if seen.get(state) == 1:
+                cycles.append(path[path.index(state):])
+            for state in path:
+                seen[state] = 2
+        return cycles
@@ -6,12 +6,18 @@ import threading
 import time
 import pygtk
 import gtk
+import gobject
 import gnome.ui
 import string
 import PIL.Image
 import piedit.colors
 import piedit.interpreter
+import piedit.blockindex
 import piedit.debug
+import piedit.grid
+import piedit.codelfile
+import piedit.output
+import piedit.inputs
 pygtk.require("2.0")
 
 __author__ = "Steven Anderson"
@@ -25,18 +31,23 @@ __status__ = "Production"
 
 
 class InterpreterThread(threading.Thread):
-    def __init__(self,pixels,width,height,callback=None,debug=False):
+    def __init__(self,block_index,callback=None,debug=False,output=None,input=None):
+        """Initializes new InterpreterThread. The output of the program goes
+        to the given piedit.output.Sink, or stdout if it isn't given, and its
+        input comes from the given piedit.inputs.Source, or stdin."""
         self.should_stop = False
         self.interpreter = piedit.interpreter.Interpreter(thread=self)
-        self.interpreter.debug.DEBUG = debug
-        self.pixels = pixels
-        self.width = width
-        self.height = height
+        self.interpreter.debug.doit = debug
+        if output != None:
+            self.interpreter.output = output
+        if input != None:
+            self.interpreter.input = input
+        self.block_index = block_index
         self.callback = callback
         threading.Thread.__init__(self)
         
     def run(self):
-        self.interpreter.run_program(pixels=self.pixels,width=self.width,height=self.height)
+        self.interpreter.run_program(block_index=self.block_index)
         self.callback(self.should_stop)
         
     def stop(self):
@@ -50,7 +61,8 @@ class Handlers(object):
         self._ui = ui
         self.file_filter = gtk.FileFilter()
         self.file_filter.add_pattern("*.png")
-        self.file_filter.set_name("PNG Files")
+        self.file_filter.add_pattern("*"+piedit.codelfile.EXTENSION)
+        self.file_filter.set_name("PNG and Codel Files")
 
     def on_mainApp_delete_event(self, *args):
         """Handler for application close"""
@@ -101,7 +113,8 @@ class Handlers(object):
         response = fileChooser.run()
         if response == gtk.RESPONSE_OK:
             filename = fileChooser.get_filename()
-            if (not filename == None) and (not filename.endswith(".png")):
+            if (not filename == None) and (not filename.endswith(".png"))\
+                and (not filename.endswith(piedit.codelfile.EXTENSION)):
                 filename = filename + ".png"
             self._ui.save_image(filename)
             fileChooser.destroy()
@@ -120,7 +133,10 @@ class Handlers(object):
         """Handler for Run|Run menu item"""
         self.run_mode = "Run"
         self.set_run_menu(running=True,status="Running...")
-        self.interpreter_thread = InterpreterThread(pixels=self._ui.pixels,width=self._ui.width,height=self._ui.height,callback=self.thread_end_callback,debug=False)
+        self._ui.clear_output()
+        output = piedit.output.CallbackSink(self._ui.append_output,piedit.output.LINE)
+        input = piedit.inputs.MemorySource(self._ui.get_input())
+        self.interpreter_thread = InterpreterThread(block_index=self._ui.get_block_index(),callback=self.thread_end_callback,debug=False,output=output,input=input)
         self.interpreter_thread.start()
     
     def on_runDebugMenuItem_activate(self,*args):
@@ -128,13 +144,17 @@ class Handlers(object):
         self.run_mode = "Debug"
         self.set_run_menu(running=True,status="Debugging...",debug=True)
         self._ui.interpreter = piedit.interpreter.Interpreter()
-        self._ui.interpreter.debug.DEBUG = True
-        self._ui.interpreter.run_program(pixels=self._ui.pixels,width=self._ui.width,height=self._ui.height,start=False)
+        self._ui.interpreter.debug.doit = True
+        self._ui.clear_output()
+        #Each step's output is shown as it is stepped through
+        self._ui.interpreter.output = piedit.output.CallbackSink(self._ui.insert_output,piedit.output.UNBUFFERED)
+        self._ui.interpreter.input = piedit.inputs.MemorySource(self._ui.get_input())
+        self._ui.interpreter.run_program(block_index=self._ui.get_block_index(),start=False)
         self._ui.highlight_pixel(0,0)
     
     def on_runStepMenuItem_activate(self,*args):
         if self._ui.interpreter.do_next_debug_step():
-            self._ui.highlight_pixel(self._ui.interpreter.current_pixel.x,self._ui.interpreter.current_pixel.y)
+            self._ui.highlight_pixel(*self._ui.interpreter.current_pixel_coords)
         else:
             self.set_run_menu(running=False,status="Complete")
 
@@ -142,7 +162,7 @@ class Handlers(object):
         if self.run_mode == "Run":
             self.interpreter_thread.stop()
         elif self.run_mode == "Debug":
-            self.thread_end_callback(self._ui.interpreter.debug.DEBUG)
+            self.thread_end_callback(self._ui.interpreter.debug.doit)
         
     def set_run_menu(self,running,status,debug=False):
         if running:
@@ -201,7 +221,7 @@ class Handlers(object):
     def on_toolbarStep_clicked(self,*args):
         return self.on_runStepMenuItem_activate(*args)
     
-    def on_toolbarStop_clicked(self,*args):
+    def on_toolbarStop_clicked(self,*args):
         return self.on_runStopMenuItem_activate(*args)
     
     def on_toolbarHelp_clicked(self,*args):
@@ -250,6 +270,7 @@ class UI(object):
         self.max_width = 1000
         self.max_height = 1000
         self.current_pixel = None
+        self.block_index = None
         
         self.handlers = Handlers(self)
         self.gladeui.signal_autoconnect(self.handlers)
@@ -257,30 +278,48 @@ class UI(object):
         self.initialise_ui()
 
     def save_image(self,path):
-        """Saves the current program table to an image"""
-        image = PIL.Image.new("RGB",(self.width,self.height))
-        image.putdata([piedit.colors.hex_to_rgb(p) for p in self.pixels])
-        image.save(path, "PNG")
+        """Saves the current program table to an image, or to a codel file
+        if the path ends with its extension"""
+        if path.endswith(piedit.codelfile.EXTENSION):
+            piedit.codelfile.save(path,piedit.grid.from_pixels(self.pixels,self.width,self.height))
+        else:
+            #Saved as a palette image, straight from the palette indices
+            image = PIL.Image.frombytes("P",(self.width,self.height),str(self.pixels))
+            image.putpalette(piedit.colors.flat_palette)
+            image.save(path, "PNG")
         self.message_handler.handle_message("FILE_SAVED")
         self.set_current_file(path)
         self.set_changes_made(False)
         self.set_window_title(os.path.basename(path))
     
     def load_image(self,path):
-        """Loads an image from file and displays it in the program table"""
+        """Loads an image or codel file and displays it in the program table"""
         try:
-            image = PIL.Image.open(path)
-            if image.mode != "RGB":
-                image = image.convert("RGB")
+            if piedit.codelfile.is_codel_file(path):
+                (codel_grid, color_blocks) = piedit.codelfile.load(path)
+                image = None
+                (self.width, self.height) = (codel_grid.width, codel_grid.height)
+            else:
+                image = PIL.Image.open(path)
+                if image.mode not in ["RGB","P"]:
+                    image = image.convert("RGB")
+                (self.width, self.height) = image.size
         except IOError:
             self.message_handler.handle_error("FILE_NOT_LOADED")
-        (self.width, self.height) = image.size
+            return
         if self.width>self.max_width or self.height>self.max_height:
             self.message_handler.handle_error("IMAGE_TOO_BIG")
         else:
             self.clear_image(self.width,self.height)
-            self.pixels = [piedit.colors.rgb_to_hex(rgb) for rgb in image.getdata()]
+            if image == None:
+                self.pixels = bytearray(codel_grid.codels)
+            else:
+                self.pixels = piedit.colors.image_to_indices(image)
+            self.block_index = None
             self.draw_program_table()
+        if image == None:
+            #The codels have been copied out, or aren't wanted
+            codel_grid.mapping.close()
         self.set_current_file(path)
         self.set_changes_made(False)
         self.set_window_title(os.path.basename(path))
@@ -290,8 +329,9 @@ class UI(object):
         self.height=height
         self.width=width
         self.gladeui.get_widget("programTable").window.clear()
-        self.pixels = [piedit.colors.white for y in xrange(self.height) for x in xrange(self.width)]
+        self.pixels = bytearray([piedit.colors.white_index])*(self.width*self.height)
         self.current_pixel=None
+        self.block_index = None
         self.set_current_file(None)
         self.set_window_title("Untitled.png")
         self.set_changes_made(False)
@@ -333,8 +373,10 @@ class UI(object):
                 y_sum = y
         y = y_counter        
         
-        if self.selected_color:
+        if self.selected_color != None:
             self.pixels[y*self.width+x] = self.selected_color
+            if self.block_index != None:
+                self.block_index.set_codel(x,y,self.selected_color)
             self.set_changes_made(True)
             self.draw_program_table([x],[y])
 
@@ -345,7 +387,7 @@ class UI(object):
         except AttributeError:
             pass
         color_widget.modify_bg(gtk.STATE_NORMAL, gtk.gdk.color_parse("#333333"))
-        self.selected_color = color_widget.default_color
+        self.selected_color = color_widget.color_index
         self.selected_color_widget = color_widget
         
     def set_changes_made(self,changes):
@@ -416,6 +458,7 @@ class UI(object):
             event_box.modify_bg(gtk.STATE_NORMAL, gtk.gdk.color_parse(color))
             event_box.set_size_request(-1,30)
             event_box.default_color=color
+            event_box.color_index=i
             event_box.connect("button_press_event", self.handlers.on_codelColorEventBox_clicked)   
             event_box.show()
         
@@ -467,13 +510,15 @@ class UI(object):
                 program_table.draw_rectangle(gc,False,l,t,w,h)    
                 try:
                     pixel = self.pixels[y*self.width+x]
-                    fg = colormap.alloc_color(pixel)
+                    fg = colormap.alloc_color(piedit.colors.colors[pixel])
                     gc.set_foreground(fg)
                 except AttributeError:
                     gc.set_foreground(white)
                 program_table.draw_rectangle(gc,True,l+1,t+1,w-1,h-1)          
 
     def highlight_pixel(self,x,y):
+        """Highlights the codel at the given x and y. Programs are run from
+        the editor with one pixel to a codel, so it is a single pixel."""
         if self.current_pixel == None:
             old_x,old_y = 0,0
         else:
@@ -482,10 +527,38 @@ class UI(object):
         self.draw_program_table([old_x,x],[old_y,y])
         self.draw_program_table([x],[y])
     
+    def get_input(self):
+        """Gets the input typed for the program to read"""
+        return self.gladeui.get_widget("inputEntry").get_text()
+
+    def clear_output(self):
+        """Empties the output view"""
+        self.gladeui.get_widget("outputTextView").get_buffer().set_text("")
+
+    def append_output(self,text):
+        """Adds output of the program to the output view. It is called from
+        the interpreter thread, so the text is added by the GTK main loop."""
+        gobject.idle_add(self.insert_output,text)
+
+    def insert_output(self,text):
+        """Inserts text at the end of the output view"""
+        text_buffer = self.gladeui.get_widget("outputTextView").get_buffer()
+        #OUT(Char) writes any byte, which may not be valid UTF-8
+        text_buffer.insert(text_buffer.get_end_iter(),text.decode("latin-1"))
+        return False
+
+    def get_block_index(self):
+        """Gets the index of the program color blocks, labeling the whole
+        program if it was loaded or resized since the last run"""
+        if self.block_index == None:
+            self.block_index = piedit.blockindex.BlockIndex(self.pixels,self.width,self.height)
+        return self.block_index
+    
     def increase_width(self):
         for i,y in enumerate(xrange(self.height)):
-            self.pixels.insert((y*self.width+i)+self.width,piedit.colors.white)
+            self.pixels.insert((y*self.width+i)+self.width,piedit.colors.white_index)
         self.width = self.width+1
+        self.block_index = None
         self.draw_program_table()
     
     def decrease_width(self):
@@ -493,17 +566,20 @@ class UI(object):
             for i,y in enumerate(xrange(self.height)):
                 del self.pixels[(y*self.width)+self.width-1-i]
             self.width = self.width-1
+            self.block_index = None
             self.draw_program_table()
 
     def increase_height(self):
-        self.pixels.extend([piedit.colors.white for x in xrange(self.width)])
+        self.pixels.extend(bytearray([piedit.colors.white_index])*self.width)
         self.height = self.height+1
+        self.block_index = None
         self.draw_program_table()
     
     def decrease_height(self):
         if self.height > 1:
-            self.pixels[self.width*self.height-self.width:] = []
+            del self.pixels[self.width*self.height-self.width:]
             self.height = self.height-1
+            self.block_index = None
             self.draw_program_table()
 
     
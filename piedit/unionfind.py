@@ -1,6 +1,8 @@
 """Module for the union-find functions for the piet interpreter"""
 
 import sys
+import itertools
+from array import array
 
 __author__ = "Steven Anderson"
 __copyright__ = "Steven Anderson 2008"
@@ -11,27 +13,60 @@ __maintainer__ = "Steven Anderson"
 __email__ = "steven.james.anderson@googlemail.com"
 __status__ = "Production"
 
-def union(parent,child):
-    """Performs a union by attaching the root node of the smaller set to the
-    root node of the larger set"""
-    if parent.set_size < child.set_size:
-        child, parent = parent, child
-        
-    parent_head = find(parent)
-    child_head = find(child)
-    
-    if parent_head == child_head:
-        return
-    
-    child_head.parent = parent_head
-    child_head.set_label = parent_head.set_label
-    parent_head.set_size = parent_head.set_size + child_head.set_size
-
-def find(item):
-    """Finds the root node of a given item, attaching it directly to its root node
-    on the way up"""
-    if item.parent == item:
-        return item
-    else:
-        item.parent = find(item.parent)
-        return item.parent
\ No newline at end of file
+class UnionFind(object):
+    """Disjoint sets over the labels 0..n-1, kept in flat integer arrays.
+    Nothing here recurses, so it copes with any shape of color block."""
+
+    def __init__(self,size=0):
+        """Initializes new UnionFind with the given number of single sets."""
+        self.parents = array('i',xrange(size))
+        self.sizes = array('i',[1])*size
+
+    def __len__(self):
+        """Gets the number of labels."""
+        return len(self.parents)
+
+    def add(self):
+        """Adds a new single set and returns its label."""
+        label = len(self.parents)
+        self.parents.append(label)
+        self.sizes.append(1)
+        return label
+
+    def find(self,item):
+        """Finds the root label of a given label, attaching every label on the
+        way up directly to the root."""
+        parents = self.parents
+        root = item
+        while parents[root] != root:
+            root = parents[root]
+        while parents[item] != root:
+            parents[item], item = root, parents[item]
+        return root
+
+    def union(self,first,second):
+        """Performs a union by attaching the root of the smaller set to the
+        root of the larger set. Returns the new root."""
+        first = self.find(first)
+        second = self.find(second)
+        if first == second:
+            return first
+
+        sizes = self.sizes
+        if sizes[first] < sizes[second]:
+            first, second = second, first
+        self.parents[second] = first
+        sizes[first] = sizes[first] + sizes[second]
+        return first
+
+    def union_pairs(self,firsts,seconds):
+        """Performs a union on every pair of labels taken from the two
+        sequences in one call."""
+        union = self.union
+        for first,second in itertools.izip(firsts,seconds):
+            union(first,second)
+
+    def roots(self):
+        """Returns an array holding the root label of every label."""
+        find = self.find
+        return array('i',(find(label) for label in xrange(len(self.parents))))
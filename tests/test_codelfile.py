@@ -0,0 +1,101 @@
+"""Tests that codel files load as they were saved, and that damaged ones are
+rejected instead of being indexed past their ends"""
+
+import os
+import sys
+import struct
+import shutil
+import tempfile
+import unittest
+
+sys.path.insert(0,os.path.join(os.path.dirname(os.path.abspath(__file__)),"..","piedit"))
+import colors
+import grid
+import codelfile
+
+__author__ = "Steven Anderson"
+__copyright__ = "Steven Anderson 2008"
+__credits__ = ["Steven Anderson"]
+__license__ = "GPL"
+__version__ = "0.0.1"
+__maintainer__ = "Steven Anderson"
+__email__ = "steven.james.anderson@googlemail.com"
+__status__ = "Production"
+
+#Codels drawn 2 pixels wide, with a white and a black codel
+WIDTH = 6
+HEIGHT = 4
+CODELS = bytearray([1,1,4,4,colors.white_index,colors.white_index,
+    1,1,4,4,colors.white_index,colors.white_index,
+    7,7,colors.black_index,colors.black_index,1,1,
+    7,7,colors.black_index,colors.black_index,1,1])
+
+
+class CodelFileTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory,"program"+codelfile.EXTENSION)
+        self.save()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def save(self):
+        """Saves the codels and their labels to the file."""
+        codel_grid = grid.CodelGrid(WIDTH,HEIGHT,bytearray(CODELS))
+        codelfile.save(self.path,codel_grid,grid.label_blocks(codel_grid))
+
+    def damage(self,offset,integer):
+        """Writes a 32 bit integer over the file at the given offset."""
+        codel_file = open(self.path,"r+b")
+        try:
+            codel_file.seek(offset)
+            codel_file.write(struct.pack("<i",integer))
+        finally:
+            codel_file.close()
+
+    def test_load(self):
+        codel_grid, color_blocks = codelfile.load(self.path)
+        expected = grid.CodelGrid(WIDTH,HEIGHT,bytearray(CODELS))
+        expected_blocks = grid.label_blocks(expected)
+        self.assertEqual(list(codel_grid.labels),list(expected.labels))
+        self.assertEqual(list(codel_grid.sizes),list(expected.sizes))
+        for label,color_block in expected_blocks.items():
+            self.assertEqual(color_blocks[label].boundary_pixels,color_block.boundary_pixels)
+        codel_grid.mapping.close()
+
+    def test_rows_and_columns_of_mapped_codels(self):
+        codel_grid, color_blocks = codelfile.load(self.path)
+        expected = grid.CodelGrid(WIDTH,HEIGHT,bytearray(CODELS))
+        self.assertEqual(list(codel_grid.rows()),list(expected.rows()))
+        self.assertEqual(list(codel_grid.columns()),list(expected.columns()))
+        self.assertEqual(grid.detect_codel_size(codel_grid),2)
+        codel_grid.mapping.close()
+
+    def test_damaged_labels(self):
+        labels = codelfile.header_format.size+codelfile.padded(WIDTH*HEIGHT)
+        block_count = len(grid.label_blocks(grid.CodelGrid(WIDTH,HEIGHT,bytearray(CODELS))))
+        sizes = labels+4*WIDTH*HEIGHT
+        boundaries = sizes+4*block_count
+        #A label past the last block, a colored codel without a block, a
+        #size that doesn't add up, and a boundary pixel outside the grid or
+        #in another block
+        for offset,integer in [(labels,block_count),(labels,-1),(labels,-2),(labels+16,0),
+            (sizes,0),(sizes,9),(boundaries,WIDTH),(boundaries+4,-1),(boundaries,2)]:
+            self.save()
+            self.damage(offset,integer)
+            self.assertRaises(IOError,codelfile.load,self.path)
+
+    def test_codel_outside_palette(self):
+        codel_file = open(self.path,"r+b")
+        try:
+            codel_file.seek(codelfile.header_format.size)
+            codel_file.write(chr(len(colors.colors)))
+        finally:
+            codel_file.close()
+        self.assertRaises(IOError,codelfile.load,self.path)
+
+
+if __name__ == "__main__":
+    unittest.main()
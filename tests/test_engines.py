@@ -0,0 +1,140 @@
+"""Tests that the compiled engines run programs exactly as the step
+interpreter does, with a step limit and without one"""
+
+import os
+import sys
+import random
+import unittest
+
+sys.path.insert(0,os.path.join(os.path.dirname(os.path.abspath(__file__)),"..","piedit"))
+import colors
+import interpreter
+import output
+import inputs
+
+__author__ = "Steven Anderson"
+__copyright__ = "Steven Anderson 2008"
+__credits__ = ["Steven Anderson"]
+__license__ = "GPL"
+__version__ = "0.0.1"
+__maintainer__ = "Steven Anderson"
+__email__ = "steven.james.anderson@googlemail.com"
+__status__ = "Production"
+
+PROGRAMS = os.path.join(os.path.dirname(os.path.abspath(__file__)),"..","programs")
+ENGINES = ["table","fused","memo","jit"]
+#Sample programs that finish, so they can be run without a step limit
+FINISHING = ["hello.png","99bottles.png"]
+#Step limits that cut programs off at the start, part way round loops that
+#have been traced and compiled, and late on
+STEP_LIMITS = [1,2,3,10,51,137,1000,20000]
+
+
+def run(engine,max_steps,path=None,pixels=None,width=None,height=None,data="12 -7 abc"):
+    """Runs a program on an engine and returns the interpreter."""
+    program = interpreter.Interpreter(max_steps=max_steps)
+    program.engine = engine
+    program.output = output.MemorySink()
+    program.input = inputs.MemorySource(data)
+    program.error = None
+    try:
+        program.run_program(path,pixels=pixels,width=width,height=height)
+    except (ZeroDivisionError,ValueError), err:
+        #Divide and Mod by zero, and OUT(Char) of a number that isn't a
+        #character, stop the program on every engine
+        program.error = err.__class__.__name__
+    return program
+
+def result(program):
+    """Gets the output of a program and everything the engine puts back into
+    the interpreter when it stops."""
+    return {"output": program.output.getvalue(),
+        "stack": list(program.stack),
+        "dp": program.dp,
+        "cc": program.cc,
+        "step": program.current_step,
+        "position": program.current_pixel_coords,
+        "finished": program.finished,
+        "error": program.error}
+
+def random_program(rng,width,height,black=0):
+    """Builds a program of random rectangles of color, some white and black,
+    so that it has loops as well as straight paths. The more black codels
+    there are in the background, the more often the program finishes."""
+    background = range(18)+[colors.black_index]*black
+    pixels = bytearray(rng.choice(background) for i in xrange(width*height))
+    for rectangle in xrange(rng.randint(2,20)):
+        color = rng.choice(range(18)*2+[colors.white_index,colors.black_index])
+        x0, y0 = rng.randrange(width), rng.randrange(height)
+        for y in xrange(y0,min(height,y0+rng.randint(1,5))):
+            for x in xrange(x0,min(width,x0+rng.randint(1,5))):
+                pixels[y*width+x] = color
+    #The interpreter can't start on black
+    pixels[0] = rng.randrange(18)
+    return pixels
+
+
+class EngineTest(unittest.TestCase):
+    """Compares each engine with the step interpreter."""
+
+    def setUp(self):
+        interpreter.error_handler = interpreter.ErrorHandler(False)
+
+    def assert_same_run(self,max_steps,**program):
+        """Checks that every engine runs a program as the step interpreter
+        does. Returns what the step interpreter did and the statistics of
+        each engine."""
+        expected = result(run("step",max_steps,**program))
+        stats = {}
+        for engine in ENGINES:
+            runner = run(engine,max_steps,**program)
+            actual = result(runner)
+            for key in sorted(expected.keys()):
+                self.assertEqual(actual[key],expected[key],"%s engine, %s steps: %s is %r, not %r" %
+                    (engine,max_steps,key,actual[key],expected[key]))
+            stats[engine] = dict(runner.stats)
+            #There are no statistics if the program stopped with an error
+            stats[engine].setdefault("Traces that loop",0)
+        return expected, stats
+
+    def test_sample_programs(self):
+        for name in sorted(os.listdir(PROGRAMS)):
+            for max_steps in [1,137,20000]:
+                self.assert_same_run(max_steps,path=os.path.join(PROGRAMS,name))
+
+    def test_unlimited_steps(self):
+        for name in FINISHING:
+            expected, stats = self.assert_same_run(-1,path=os.path.join(PROGRAMS,name))
+            self.assertTrue(expected["finished"])
+            if name == "99bottles.png":
+                #Its loops are traced, and left by a guard
+                self.assertTrue(stats["jit"]["Traces that loop"] > 0)
+                self.assertTrue(stats["jit"]["Traces exited by a guard"] > 0)
+
+    def test_random_programs(self):
+        rng = random.Random(12)
+        looping = 0
+        for trial in xrange(40):
+            width, height = rng.randint(3,14), rng.randint(3,14)
+            pixels = random_program(rng,width,height)
+            for max_steps in STEP_LIMITS:
+                expected, stats = self.assert_same_run(max_steps,pixels=pixels,width=width,height=height)
+                looping = looping + stats["jit"]["Traces that loop"]
+        #Step limits fall part way round compiled loops
+        self.assertTrue(looping > 0)
+
+    def test_random_programs_unlimited(self):
+        rng = random.Random(120)
+        finishing = 0
+        for trial in xrange(200):
+            width, height = rng.randint(3,14), rng.randint(3,14)
+            pixels = random_program(rng,width,height,6)
+            if not run("step",20000,pixels=pixels,width=width,height=height).finished:
+                continue
+            finishing = finishing + 1
+            self.assert_same_run(-1,pixels=pixels,width=width,height=height)
+        self.assertTrue(finishing > 5)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,71 @@
+"""Tests how IN(Char) and IN(Number) take input from a source"""
+
+import os
+import sys
+import unittest
+import StringIO
+
+sys.path.insert(0,os.path.join(os.path.dirname(os.path.abspath(__file__)),"..","piedit"))
+import inputs
+
+__author__ = "Steven Anderson"
+__copyright__ = "Steven Anderson 2008"
+__credits__ = ["Steven Anderson"]
+__license__ = "GPL"
+__version__ = "0.0.1"
+__maintainer__ = "Steven Anderson"
+__email__ = "steven.james.anderson@googlemail.com"
+__status__ = "Production"
+
+
+def read_all(source):
+    """Reads numbers from a source, and a character wherever there is no
+    number, until the input ends."""
+    items = []
+    while True:
+        number = source.read_number()
+        if number != None:
+            items.append(number)
+            continue
+        char = source.read_char()
+        if char == None:
+            return items
+        items.append(char)
+
+def sources(data):
+    """Gets sources of the data, buffered whole and a character at a time."""
+    return [inputs.MemorySource(data),
+        inputs.StreamSource(StringIO.StringIO(data)),
+        inputs.StreamSource(StringIO.StringIO(data),1)]
+
+
+class SourceTest(unittest.TestCase):
+
+    def test_numbers(self):
+        for source in sources(" 12\t-34\n+5 007 -0 123456789012345678901234567890"):
+            self.assertEqual(read_all(source),[12,-34,5,7,0,123456789012345678901234567890])
+
+    def test_number_leaves_what_ends_it(self):
+        for source in sources("42\nab"):
+            self.assertEqual(source.read_number(),42)
+            self.assertEqual(source.read_char(),"\n")
+            self.assertEqual(source.read_number(),None)
+            self.assertEqual(source.read_char(),"a")
+
+    def test_no_number_takes_only_whitespace(self):
+        #A sign without digits is left, as any other character is
+        for source in sources(" x -y + 8 +-3 -"):
+            self.assertEqual(read_all(source),["x","-","y","+",8,"+",-3,"-"])
+
+    def test_end_of_input(self):
+        for source in sources(""):
+            self.assertEqual(source.read_number(),None)
+            self.assertEqual(source.read_char(),None)
+        for source in sources("7  "):
+            self.assertEqual(source.read_number(),7)
+            self.assertEqual(source.read_number(),None)
+            self.assertEqual(source.read_char(),None)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,225 @@
+"""Tests that the closed forms of counting loops agree with going round the
+same loops one time at a time"""
+
+import os
+import sys
+import random
+import unittest
+
+sys.path.insert(0,os.path.join(os.path.dirname(os.path.abspath(__file__)),"..","piedit"))
+import codegen
+import loops
+import stack
+
+__author__ = "Steven Anderson"
+__copyright__ = "Steven Anderson 2008"
+__credits__ = ["Steven Anderson"]
+__license__ = "GPL"
+__version__ = "0.0.1"
+__maintainer__ = "Steven Anderson"
+__email__ = "steven.james.anderson@googlemail.com"
+__status__ = "Production"
+
+#Operations a counting loop may be made of
+OPS = [codegen.PUSH,codegen.POP,codegen.ADD,codegen.SUBTRACT,codegen.MULTIPLY,
+    codegen.DIVIDE,codegen.MOD,codegen.NOT,codegen.GREATER,codegen.DUPLICATE,
+    codegen.POINTER,codegen.SWITCH]
+#Loops that count, left by a Pointer or Switch guard
+TEMPLATES = [
+    #Count down by 1 until the counter is 0
+    [(codegen.PUSH,1),(codegen.SUBTRACT,0),(codegen.DUPLICATE,0),(codegen.NOT,0),(codegen.POINTER,0)],
+    #Count up by 3 until the counter is above 50
+    [(codegen.PUSH,3),(codegen.ADD,0),(codegen.DUPLICATE,0),(codegen.PUSH,50),(codegen.GREATER,0),(codegen.POINTER,0)],
+    #Count down by 2 while the counter is above 0
+    [(codegen.PUSH,2),(codegen.SUBTRACT,0),(codegen.DUPLICATE,0),(codegen.PUSH,0),(codegen.GREATER,0),(codegen.SWITCH,True)],
+]
+#Most times round a loop is gone round one at a time
+MAX_ROUNDS = 400
+
+
+def go_round(items,ops):
+    """Goes round a loop once on a list of items, as the compiled function
+    does. Returns the number of operations done, which is less than the
+    length of the loop if an operation failed or a guard wasn't met. The
+    items are left as the operations before that one left them, and
+    unchanged if there weren't enough for the whole loop."""
+    before = list(items)
+    for count, (op, value) in enumerate(ops):
+        try:
+            if op == codegen.PUSH:
+                items.append(value)
+            elif op == codegen.POP:
+                items.pop()
+            elif op in [codegen.ADD,codegen.SUBTRACT,codegen.MULTIPLY,codegen.DIVIDE,codegen.MOD,codegen.GREATER]:
+                top, second = items.pop(), items.pop()
+                if op in [codegen.DIVIDE,codegen.MOD] and top == 0:
+                    items.extend([second,top])
+                    return count
+                items.append({codegen.ADD: lambda: second+top,
+                    codegen.SUBTRACT: lambda: second-top,
+                    codegen.MULTIPLY: lambda: second*top,
+                    codegen.DIVIDE: lambda: second/top,
+                    codegen.MOD: lambda: second%top,
+                    codegen.GREATER: lambda: int(second > top)}[op]())
+            elif op == codegen.NOT:
+                items.append(int(not items.pop()))
+            elif op == codegen.DUPLICATE:
+                items.append(items[-1])
+            elif op == codegen.POINTER:
+                if items[-1]%4 != value:
+                    return count
+                items.pop()
+            elif op == codegen.SWITCH:
+                if items[-1]%2 != int(bool(value)):
+                    return count
+                items.pop()
+        except IndexError:
+            items[:] = before
+            return 0
+    return len(ops)
+
+def brute_force(items,ops,iterations):
+    """Goes round a loop up to the given number of times, one at a time.
+    Returns the number of operations done and the number of times all the
+    way round."""
+    done = 0
+    for iteration in xrange(iterations):
+        count = go_round(items,ops)
+        done = done + count
+        if count < len(ops):
+            return done, iteration
+    return done, iterations
+
+def random_loop(rng):
+    """Builds a loop of random operations, or a template with some added."""
+    if rng.random() < 0.4:
+        ops = list(rng.choice(TEMPLATES))
+        for extra in xrange(rng.randint(0,2)):
+            ops.insert(rng.randint(0,len(ops)),(rng.choice(OPS),rng.randint(0,5)))
+    else:
+        ops = [(rng.choice(OPS),rng.randint(0,5)) for i in xrange(rng.randint(2,7))]
+    return [(op, (value, value%4, value%2 == 1)[(op == codegen.POINTER) + 2*(op == codegen.SWITCH)]) for op, value in ops]
+
+
+class FailsAtTest(unittest.TestCase):
+    """Compares loops.fails_at with going round one time at a time."""
+
+    def brute_force(self,kind,value,change,needed):
+        for iteration in xrange(MAX_ROUNDS):
+            total = value + iteration*change
+            if kind == loops.ZERO:
+                passes = int(total == 0) == needed
+            elif kind == loops.POSITIVE:
+                passes = int(total > 0) == needed
+            elif kind == "modulo":
+                passes = total%4 == needed
+            else:
+                passes = total%2 == needed
+            if not passes:
+                return iteration
+        return None
+
+    def test_zero_and_positive(self):
+        #Small values and changes cover every ceil and floor edge, with the
+        #sum landing on, just before and just past zero
+        for kind in [loops.ZERO,loops.POSITIVE]:
+            for needed in [0,1]:
+                for value in xrange(-25,26):
+                    for change in xrange(-7,8):
+                        self.assertEqual(loops.fails_at(kind,value,change,needed),
+                            self.brute_force(kind,value,change,needed),
+                            "%s guard needing %d from %d by %d" % (kind,needed,value,change))
+
+    def test_modulo_and_parity(self):
+        #These guards can't depend on the counter, so the sum doesn't change
+        for value in xrange(-9,10):
+            for needed in xrange(4):
+                self.assertEqual(loops.fails_at("modulo",value,0,needed),self.brute_force("modulo",value,0,needed))
+            for needed in [0,1]:
+                self.assertEqual(loops.fails_at("parity",value,0,needed),self.brute_force("parity",value,0,needed))
+
+
+class CountingLoopTest(unittest.TestCase):
+    """Compares CountingLoop with going round its loop one time at a time."""
+
+    def test_templates_are_counting_loops(self):
+        for ops in TEMPLATES:
+            self.assertNotEqual(loops.find_counting_loop(ops),None)
+
+    def test_not_counting(self):
+        #Output
+        self.assertEqual(loops.find_counting_loop([(codegen.DUPLICATE,0),(codegen.OUT_NUMBER,0),(codegen.PUSH,1),(codegen.SUBTRACT,0)]),None)
+        #Dividing by a constant zero fails part way through every time round
+        self.assertEqual(loops.find_counting_loop([(codegen.PUSH,0),(codegen.DIVIDE,0)]),None)
+        self.assertEqual(loops.find_counting_loop([(codegen.PUSH,5),(codegen.PUSH,0),(codegen.MOD,0),(codegen.ADD,0)]),None)
+        #Dividing by an item that changes
+        self.assertEqual(loops.find_counting_loop([(codegen.DUPLICATE,0),(codegen.PUSH,1),(codegen.SUBTRACT,0),(codegen.DIVIDE,0)]),None)
+        #Roll, which a trace doesn't hold
+        self.assertEqual(loops.find_counting_loop([(codegen.PUSH,1),(codegen.ADD,0),(codegen.PUSH,2),(codegen.PUSH,1),(codegen.ROLL,0)]),None)
+        #A counter that grows faster each time round
+        self.assertEqual(loops.find_counting_loop([(codegen.PUSH,2),(codegen.MULTIPLY,0)]),None)
+
+    def test_iterations(self):
+        rng = random.Random(15)
+        checked = 0
+        for trial in xrange(20000):
+            ops = random_loop(rng)
+            counting_loop = loops.find_counting_loop(ops)
+            if counting_loop == None:
+                continue
+            for start in xrange(3):
+                items = [rng.randint(-60,60) for i in xrange(counting_loop.reads+rng.randint(0,2))]
+                iterations = counting_loop.iterations(items)
+                done, rounds = brute_force(list(items),ops,MAX_ROUNDS)
+                if rounds == MAX_ROUNDS:
+                    self.assertTrue(iterations == None or iterations >= MAX_ROUNDS,"%r from %r" % (ops,items))
+                else:
+                    self.assertEqual(iterations,rounds,"%r from %r" % (ops,items))
+                checked = checked + 1
+        self.assertTrue(checked > 500)
+
+    def test_accelerated(self):
+        #Up to the given iterations, as the steps left allow, the skipping
+        #function does what going round one at a time does
+        rng = random.Random(150)
+        checked = 0
+        for trial in xrange(20000):
+            ops = random_loop(rng)
+            counting_loop = loops.find_counting_loop(ops)
+            if counting_loop == None:
+                continue
+            code = codegen.StraightLine("loop",True)
+            for op, value in ops:
+                code.add_op(op,value)
+            accelerated = counting_loop.accelerate(code.compile(),len(ops))
+            for start in xrange(3):
+                items = [rng.randint(-60,60) for i in xrange(rng.randint(0,counting_loop.reads+2))]
+                iterations = rng.choice([1,2,3,17,MAX_ROUNDS])
+                expected = list(items)
+                done, rounds = brute_force(expected,ops,iterations)
+                actual = stack.Stack(items)
+                self.assertEqual(accelerated(actual,iterations,None),done,"%r from %r" % (ops,items))
+                self.assertEqual(list(actual),expected,"%r from %r" % (ops,items))
+                checked = checked + 1
+        self.assertTrue(checked > 500)
+
+    def test_large_counts(self):
+        #A countdown from far away is skipped in one go
+        counting_loop = loops.find_counting_loop(TEMPLATES[0])
+        items = stack.Stack([7,10**12])
+        self.assertEqual(counting_loop.iterations(items),10**12-1)
+        code = codegen.StraightLine("loop",True)
+        for op, value in TEMPLATES[0]:
+            code.add_op(op,value)
+        accelerated = counting_loop.accelerate(code.compile(),len(TEMPLATES[0]))
+        #Cut off by the steps left before the guard fails
+        self.assertEqual(accelerated(items,1000,None),1000*len(TEMPLATES[0]))
+        self.assertEqual(list(items),[7,10**12-1000])
+        #Stopped at the Pointer the time round the counter gets to 0
+        done = accelerated(items,10**13,None)
+        self.assertEqual(list(items),[7,0,1])
+        self.assertEqual(done,(10**12-1000-1)*len(TEMPLATES[0])+4)
+
+
+if __name__ == "__main__":
+    unittest.main()
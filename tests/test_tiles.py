@@ -0,0 +1,83 @@
+"""Tests that labeling color blocks on several processes gives exactly the
+labels of the serial labeler"""
+
+import os
+import sys
+import random
+import unittest
+
+sys.path.insert(0,os.path.join(os.path.dirname(os.path.abspath(__file__)),"..","piedit"))
+import colors
+import grid
+import tiles
+
+__author__ = "Steven Anderson"
+__copyright__ = "Steven Anderson 2008"
+__credits__ = ["Steven Anderson"]
+__license__ = "GPL"
+__version__ = "0.0.1"
+__maintainer__ = "Steven Anderson"
+__email__ = "steven.james.anderson@googlemail.com"
+__status__ = "Production"
+
+
+def random_grid(rng,width,height,palette):
+    """Builds a grid of codels picked at random from the palette."""
+    codels = bytearray(rng.choice(palette) for i in xrange(width*height))
+    return grid.CodelGrid(width,height,codels)
+
+def snake_grid(width,height):
+    """Builds a grid with one block winding down every row, so it crosses
+    every seam between bands several times, with black between its turns."""
+    codels = bytearray([colors.black_index])*(width*height)
+    for y in xrange(0,height,2):
+        codels[y*width:(y+1)*width] = bytearray([1])*width
+        if y+1 < height:
+            x = (width-1,0)[(y//2)%2]
+            codels[(y+1)*width+x] = 1
+    return grid.CodelGrid(width,height,codels)
+
+
+class LabelBlocksTest(unittest.TestCase):
+    """Compares tiles.label_blocks with grid.label_blocks."""
+
+    def assert_same_labels(self,codel_grid,jobs):
+        serial = grid.CodelGrid(codel_grid.width,codel_grid.height,bytearray(codel_grid.codels))
+        parallel = grid.CodelGrid(codel_grid.width,codel_grid.height,bytearray(codel_grid.codels))
+        serial_blocks = grid.label_blocks(serial)
+        parallel_blocks = tiles.label_blocks(parallel,jobs)
+        self.assertEqual(list(parallel.labels),list(serial.labels))
+        self.assertEqual(list(parallel.sizes),list(serial.sizes))
+        self.assertEqual(sorted(parallel_blocks.keys()),sorted(serial_blocks.keys()))
+        for label,color_block in serial_blocks.items():
+            self.assertEqual(parallel_blocks[label].size,color_block.size)
+            self.assertEqual(parallel_blocks[label].boundary_pixels,color_block.boundary_pixels)
+
+    def test_random_grids(self):
+        rng = random.Random(6)
+        #Few colors, so blocks grow across the seams
+        palettes = [[1,4,colors.white_index,colors.black_index],[1,4],range(20)]
+        for trial in xrange(30):
+            width = rng.randint(1,40)
+            height = rng.randint(1,40)
+            codel_grid = random_grid(rng,width,height,rng.choice(palettes))
+            self.assert_same_labels(codel_grid,rng.randint(2,8))
+
+    def test_one_color(self):
+        codel_grid = grid.CodelGrid(17,23,bytearray([7])*(17*23))
+        for jobs in [2,3,23,50]:
+            self.assert_same_labels(codel_grid,jobs)
+
+    def test_block_across_many_bands(self):
+        codel_grid = snake_grid(13,31)
+        for jobs in [2,4,7,31]:
+            self.assert_same_labels(codel_grid,jobs)
+
+    def test_bands_of_one_row(self):
+        rng = random.Random(60)
+        codel_grid = random_grid(rng,25,12,[2,5,colors.black_index])
+        self.assert_same_labels(codel_grid,12)
+
+
+if __name__ == "__main__":
+    unittest.main()